@@ -0,0 +1,5 @@
+# benchmarks/__init__.py
+# Performance benchmarks for TaskFlow. Install requirements-dev.txt (adds mongomock, the default --backend),
+# then run from the repository root:
+#   python -m benchmarks.run --help        data functions, page reruns and chatbot turns (JSON p50/p95 report)
+#   python -m benchmarks.fastpath --help   chatbot fast-path coverage
@@ -0,0 +1,35 @@
+# benchmarks/datagen.py
+# Synthetic users and tasks with realistic-looking distributions, inserted in batches.
+import random
+from datetime import date, datetime, timedelta
+from utils import normalize_title, priority_fields
+
+VERBS = ["Call", "Email", "Buy", "Finish", "Review", "Book", "Pay", "Clean", "Plan", "Fix", "Prepare", "Schedule", "Renew", "Send", "Update"]
+OBJECTS = ["mom", "dentist", "groceries", "quarterly report", "rent", "car service", "flights", "insurance", "garage", "slides",
+           "invoice", "team sync", "passport", "birthday gift", "budget", "pull request", "gym membership", "tax forms", "newsletter", "backup"]
+TAGS = ["Work", "Personal", "Urgent", "Shopping", "Health", "Finance", "Home", "Errands"]
+TAG_WEIGHTS = [30, 25, 8, 12, 8, 7, 6, 4] # a few tags dominate, as in real lists
+PRIORITIES, PRIORITY_WEIGHTS = ["High", "Medium", "Low"], [20, 50, 30]
+
+def make_task(rng: random.Random, username: str, today: date, index: int):
+    completed = rng.random() < 0.35
+    # Completed work skews into the past; open work clusters around the next few weeks with a long overdue tail.
+    offset = int(rng.gauss(-20, 25)) if completed else int(rng.gauss(7, 20))
+    title = f"{rng.choice(VERBS)} {rng.choice(OBJECTS)}" + (f" #{index}" if rng.random() < 0.5 else "")
+    tags = sorted(set(rng.choices(TAGS, weights=TAG_WEIGHTS, k=rng.choice([0, 1, 1, 1, 2, 2, 3]))))
+    return {"username": username, "title": title, "title_normalized": normalize_title(title), "status": "Completed" if completed else "Pending",
+            **priority_fields(rng.choices(PRIORITIES, weights=PRIORITY_WEIGHTS)[0]), "due_date": (today + timedelta(days=offset)).isoformat(),
+            "tags": tags, "created_at": datetime.utcnow() - timedelta(days=rng.randint(0, 365))}
+
+def seed(db, users: int, tasks_per_user: int, seed: int = 42, batch_size: int = 10000):
+    # Replaces the contents of db.users / db.tasks. Returns the generated usernames.
+    rng = random.Random(seed); today = date.today(); usernames = [f"bench_user_{i}" for i in range(users)]
+    db["users"].delete_many({}); db["tasks"].delete_many({})
+    db["users"].insert_many([{"username": name, "password": "bench"} for name in usernames])
+    for username in usernames:
+        batch = []
+        for index in range(tasks_per_user):
+            batch.append(make_task(rng, username, today, index))
+            if len(batch) >= batch_size: db["tasks"].insert_many(batch); batch = []
+        if batch: db["tasks"].insert_many(batch)
+    return usernames
@@ -0,0 +1,52 @@
+# benchmarks/fastpath.py
+# Measures how many chatbot turns the local fast-path parser answers without a model call, and the
+# latency that saves. Usage: python -m benchmarks.fastpath [--model-latency-ms 1800] [--repeat 200]
+import argparse
+import json
+import time
+from datetime import date
+from utils import parse_command, FASTPATH_MIN_CONFIDENCE
+
+# A mix of the assistant's own examples, common variations and turns that must go to the model.
+PROMPTS = [
+    "add task call mom tomorrow high priority", "show my pending tasks", "delete task call mom",
+    "add task buy groceries #shopping", "add a new task: finish report by friday urgent", "remind me to pay rent in 3 days",
+    "add task dentist next monday tagged health", "add task review PR today low priority", "create task renew passport 2026-12-01",
+    "list my tasks", "show my completed tasks", "what are my tasks due this week?", "show my tasks due today",
+    "list tasks tagged work", "show my overdue tasks", "mark call mom as done", "complete finish report",
+    "check off buy groceries", "remove task dentist", "delete the task renew passport",
+    "what should I work on first?", "move all my work tasks to next week", "add task meeting at 5pm tomorrow",
+    "add task call mom and then email dad", "mark call mom as high priority", "show my tasks sorted by date",
+    "delete all completed tasks", "how many tasks do I have?", "reschedule the dentist to monday", "thanks!",
+    # Modifier words inside a title must not be parsed out of it.
+    "add task fix tags parser", "add task review the monday report", "add task email boss about the urgent issue",
+    "add task buy groceries #shopping and #food",
+]
+
+def run(model_latency_ms: float, repeat: int):
+    today = date.today(); results = []
+    for prompt in PROMPTS:
+        started = time.perf_counter()
+        for _ in range(repeat): command = parse_command(prompt, today)
+        local_ms = (time.perf_counter() - started) * 1000 / repeat
+        handled = bool(command) and command["confidence"] >= FASTPATH_MIN_CONFIDENCE
+        results.append({"prompt": prompt, "handled": handled, "action": command["action"] if command else None, "parse_ms": round(local_ms, 4)})
+    handled = [r for r in results if r["handled"]]
+    saved_ms = sum(model_latency_ms - r["parse_ms"] for r in handled)
+    return {
+        "turns": len(results), "handled_locally": len(handled), "local_share": round(len(handled) / len(results), 3),
+        "parse_ms_p50": sorted(r["parse_ms"] for r in results)[len(results) // 2], "model_latency_ms": model_latency_ms,
+        "latency_saved_ms_total": round(saved_ms, 1), "latency_saved_ms_per_turn": round(saved_ms / len(results), 1), "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fast-path parser coverage and latency benchmark.")
+    parser.add_argument("--model-latency-ms", type=float, default=1800.0, help="Measured latency of a model-handled turn (two completion calls).")
+    parser.add_argument("--repeat", type=int, default=200, help="Parses per prompt when timing.")
+    parser.add_argument("--json", action="store_true", help="Print the full machine-readable report.")
+    args = parser.parse_args()
+    report = run(args.model_latency_ms, args.repeat)
+    if args.json: print(json.dumps(report, indent=2)); raise SystemExit
+    for r in report["results"]: print(f"  {'LOCAL' if r['handled'] else 'MODEL'}  {r['parse_ms']:.3f} ms  {r['prompt']}")
+    print(f"\n{report['handled_locally']}/{report['turns']} turns handled locally ({report['local_share']:.0%}); "
+          f"~{report['latency_saved_ms_per_turn']:.0f} ms saved per turn at {args.model_latency_ms:.0f} ms per model turn.")
@@ -0,0 +1,149 @@
+# benchmarks/run.py
+# Seeds a local mongod (or mongomock) with synthetic data, then times the utils.py data functions, full
+# reruns of every page through Streamlit's AppTest harness and chatbot turns against a stubbed OpenAI client.
+# Writes a JSON report with p50/p95 per operation; --compare prints the deltas against an earlier report.
+#   python -m benchmarks.run --users 3 --tasks-per-user 1000 --out before.json
+#   python -m benchmarks.run --backend mongodb://localhost:27017 --tasks-per-user 100000 --compare before.json
+import argparse
+import json
+import math
+import platform
+import subprocess
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+import openai
+from streamlit.logger import set_log_level
+import utils
+from benchmarks import datagen
+from benchmarks.stubs import StubOpenAI
+
+ROOT = Path(__file__).resolve().parent.parent
+PAGES = {"page:login": "taskflow_app.py", "page:home": "pages/1_🏠_Home.py", "page:calendar": "pages/2_🗓️_Calendar.py", "page:chatbot": "pages/3_🤖_Chatbot.py"}
+BENCH_DB = "taskflow_bench"
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples); return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+def summarize(samples: list) -> dict:
+    return {"n": len(samples), "p50_ms": round(percentile(samples, 50), 3), "p95_ms": round(percentile(samples, 95), 3),
+            "mean_ms": round(sum(samples) / len(samples), 3), "min_ms": round(min(samples), 3), "max_ms": round(max(samples), 3)}
+def time_op(repeat: int, fn, setup=None) -> list:
+    samples = []
+    for i in range(repeat):
+        if setup: setup()
+        started = time.perf_counter(); fn(i); samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+def _standalone_mongomock():
+    # mongomock has no change streams or collMod; fail them the way a standalone mongod does, so utils takes its
+    # polling and no-pre-image fallbacks.
+    import mongomock
+    from pymongo.errors import OperationFailure
+    def unsupported(*args, **kwargs): raise OperationFailure("not supported by mongomock", code=40573)
+    command = mongomock.Database.command
+    mongomock.Collection.watch = unsupported
+    mongomock.Database.command = lambda self, cmd, *args, **kwargs: unsupported() if isinstance(cmd, dict) and "collMod" in cmd else command(self, cmd, *args, **kwargs)
+
+def connect(backend: str):
+    # Points utils at the benchmark database instead of st.secrets["mongo"].
+    if backend == "mongomock":
+        import mongomock; client = mongomock.MongoClient(); _standalone_mongomock()
+    else:
+        from pymongo import MongoClient; client = MongoClient(backend)
+    utils.DB_NAME = BENCH_DB; utils.get_mongo_client = lambda: client
+    return client[BENCH_DB]
+
+def bench_data_functions(username: str, repeat: int) -> dict:
+    cache = utils.get_task_cache(); cold = lambda: cache.invalidate(username); month = date.today().replace(day=1)
+    exact_title = utils.get_tasks_collection().find_one({"username": username}, {"title": 1})["title"]
+    reads = {
+        "get_tasks[cold]": (lambda i: utils.get_tasks(username), cold),
+        "get_tasks[warm]": (lambda i: utils.get_tasks(username), None),
+        "query_task_page[pending]": (lambda i: utils.query_task_page(username, "Pending"), None),
+        "query_task_page[tag+search]": (lambda i: utils.query_task_page(username, "Pending", "Work", "report"), None),
+        "count_tasks[completed]": (lambda i: utils.count_tasks(username, "Completed"), None),
+        "get_task_tags": (lambda i: utils.get_task_tags(username), None),
+        "get_task_stats[cold]": (lambda i: utils.get_task_stats(username), cold),
+        "get_task_stats[warm]": (lambda i: utils.get_task_stats(username), None),
+        "get_calendar_events[cold]": (lambda i: utils.get_calendar_events(username, month), cold),
+        "resolve_task_title[exact]": (lambda i: utils.resolve_task_title(username, exact_title), None),
+        "resolve_task_title[fuzzy]": (lambda i: utils.resolve_task_title(username, "pay the rnet"), None),
+        "parse_command": (lambda i: utils.parse_command("add task call mom tomorrow high priority"), None),
+    }
+    results = {name: summarize(time_op(repeat, fn, setup)) for name, (fn, setup) in reads.items()}
+    utils.get_tasks(username) # writes below patch a warm cache, as they would in the app
+    results["add_task"] = summarize(time_op(repeat, lambda i: utils.add_task(username, f"Bench write {i}", "Medium", date.today().isoformat(), ["Bench"])))
+    written = [str(t["_id"]) for t in utils.get_tasks_collection().find({"username": username, "tags": "Bench"}, {"_id": 1})]
+    results["update_task_status"] = summarize(time_op(len(written), lambda i: utils.update_task_status(written[i], "Completed")))
+    results["delete_task"] = summarize(time_op(len(written), lambda i: utils.delete_task(written[i])))
+    shopping = [str(t["_id"]) for t in utils.get_tasks_collection().find({"username": username, "tags": "Shopping", "status": "Pending"}, {"_id": 1})]
+    results["bulk_complete_tasks[Shopping]"] = summarize(time_op(1, lambda i: utils.bulk_complete_tasks(username, shopping)))
+    results["bulk_reopen_tasks[Shopping]"] = summarize(time_op(1, lambda i: utils.bulk_reopen_tasks(username, shopping)))
+    return results
+
+def bench_pages(username: str, repeat: int, timeout: float) -> dict:
+    from streamlit.testing.v1 import AppTest
+    openai.OpenAI = StubOpenAI # the chatbot page builds its client from openai.OpenAI
+    def app(path: str, logged_in: bool = True):
+        at = AppTest.from_file(str(ROOT / path), default_timeout=timeout); at.secrets["openai"] = {"api_key": "stub"}
+        if logged_in:
+            at.session_state["login_state"] = True; at.session_state["user"] = username; at.session_state["era_mode"] = "Lover"
+            at.session_state["tags"] = ["Work", "Personal", "Urgent", "Shopping"]
+        return at
+    def checked(at):
+        at.run()
+        if at.exception: raise RuntimeError(f"{at.exception[0].message}")
+    results = {}
+    for name, path in PAGES.items():
+        at = app(path, logged_in=name != "page:login"); checked(at) # first run imports modules and warms caches
+        results[name] = summarize(time_op(repeat, lambda i: checked(at)))
+    chat = app(PAGES["page:chatbot"]); checked(chat)
+    def chat_turn(prompt: str):
+        chat.chat_input[0].set_value(prompt); checked(chat)
+    results["chatbot:model_turn"] = summarize(time_op(repeat, lambda i: chat_turn(f"What should I focus on this week? ({i})"))) # unique prompts bypass the response cache
+    results["chatbot:fast_path_turn"] = summarize(time_op(repeat, lambda i: chat_turn("show my pending tasks")))
+    return results
+
+def git_commit():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): return None
+
+def print_report(report: dict, baseline: dict = None):
+    base_ops = (baseline or {}).get("operations", {})
+    print(f"{'operation':<34}{'p50 ms':>10}{'p95 ms':>10}" + (f"{'Δp50':>10}{'Δp95':>10}" if baseline else ""))
+    for name, row in report["operations"].items():
+        line = f"{name:<34}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+        if name in base_ops:
+            delta = lambda key: f"{(row[key] - base_ops[name][key]) / base_ops[name][key]:+.0%}" if base_ops[name][key] else "n/a"
+            line += f"{delta('p50_ms'):>10}{delta('p95_ms'):>10}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="TaskFlow performance benchmark.")
+    parser.add_argument("--backend", default="mongomock", help="'mongomock' or a mongodb:// URI of a disposable local mongod.")
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--tasks-per-user", type=int, default=1000, help="10 to 100000.")
+    parser.add_argument("--repeat", type=int, default=20, help="Samples per operation.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-pages", action="store_true", help="Only time the utils.py data functions.")
+    parser.add_argument("--page-timeout", type=float, default=60.0)
+    parser.add_argument("--out", help="Write the JSON report here.")
+    parser.add_argument("--compare", help="Earlier JSON report to diff against.")
+    args = parser.parse_args()
+    set_log_level("error") # bare-mode "missing ScriptRunContext" noise
+
+    db = connect(args.backend)
+    started = time.perf_counter(); usernames = datagen.seed(db, args.users, args.tasks_per_user, args.seed); utils.migrate_db(db)
+    print(f"Seeded {args.users} user(s) x {args.tasks_per_user} task(s) in {time.perf_counter() - started:.1f}s ({args.backend})")
+    username = usernames[0]
+    operations = bench_data_functions(username, args.repeat)
+    if not args.skip_pages: operations.update(bench_pages(username, args.repeat, args.page_timeout))
+    report = {"meta": {"commit": git_commit(), "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"), "python": platform.python_version(),
+                       "backend": "mongomock" if args.backend == "mongomock" else "mongodb", "users": args.users,
+                       "tasks_per_user": args.tasks_per_user, "repeat": args.repeat, "seed": args.seed}, "operations": operations}
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(report, baseline)
+    if args.out: Path(args.out).write_text(json.dumps(report, indent=2)); print(f"\nReport written to {args.out}")
+
+if __name__ == "__main__":
+    main()
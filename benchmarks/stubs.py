@@ -0,0 +1,25 @@
+# benchmarks/stubs.py
+# A stand-in for openai.OpenAI that streams canned chunks, so chatbot turns can be timed offline.
+import json
+import time
+from types import SimpleNamespace
+
+def _chunk(content=None, tool_calls=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))])
+
+class StubCompletions:
+    def __init__(self, latency: float, words: int):
+        self.latency = latency; self.words = words; self.calls = 0
+
+    def create(self, model, messages, stream=False, tools=None, **kwargs):
+        # First call of a turn asks for get_tasks; the follow-up (after the tool result) streams a reply.
+        self.calls += 1; time.sleep(self.latency)
+        if tools and messages[-1]["role"] == "user":
+            call = SimpleNamespace(index=0, id=f"call_{self.calls}", function=SimpleNamespace(name="get_tasks", arguments=json.dumps({})))
+            return iter([_chunk(tool_calls=[call])])
+        return iter([_chunk(content=f"word{i} ") for i in range(self.words)])
+
+class StubOpenAI:
+    latency = 0.0; words = 40
+    def __init__(self, api_key=None, base_url=None, **kwargs):
+        self.chat = SimpleNamespace(completions=StubCompletions(StubOpenAI.latency, StubOpenAI.words))
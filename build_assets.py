@@ -0,0 +1,26 @@
+# build_assets.py
+# Pre-renders the WebP banner variants served by get_banner() into static/banners/.
+# Widths past the first one that covers the source image are skipped (they would be identical), and so is any
+# variant no smaller than the source PNG or the next wider variant; get_banner() then serves the wider file.
+# Re-run after adding or replacing a banner PNG.
+# Usage: python build_assets.py
+import os
+from PIL import Image
+from utils import BANNER_IMAGES, BANNER_WIDTHS, BANNER_DIR, FONT_DIR, FONT_WEIGHTS, banner_variant_path, render_banner
+
+os.makedirs(BANNER_DIR, exist_ok=True)
+for name in BANNER_IMAGES:
+    original = os.path.getsize(f"images/{name}.png"); sizes = []; smallest = original
+    with Image.open(f"images/{name}.png") as image: source_width = image.width
+    widths = [w for w in BANNER_WIDTHS if w < source_width] + [w for w in BANNER_WIDTHS if w >= source_width][:1]
+    for width in reversed(widths):
+        data = render_banner(name, width); path = banner_variant_path(name, width)
+        if len(data) >= smallest:
+            if os.path.exists(path): os.remove(path)
+            sizes.insert(0, f"{min(width, source_width)}px skipped ({len(data) / 1024:.0f} KB)"); continue
+        with open(path, "wb") as f: f.write(data)
+        smallest = len(data); sizes.insert(0, f"{min(width, source_width)}px {len(data) / 1024:.0f} KB")
+    print(f"{name:<14} png {original / 1024:.0f} KB -> webp {', '.join(sizes)}")
+
+missing = [f"Poppins-{weight}.woff2" for weight in FONT_WEIGHTS if not os.path.exists(os.path.join(FONT_DIR, f"Poppins-{weight}.woff2"))]
+if missing: print(f"\nSelf-hosted fonts missing from {FONT_DIR}/: {', '.join(missing)} (optional; titles use the default font)")
@@ -0,0 +1,15 @@
+# migrate_db.py
+# One-off schema migration for taskflow_db: creates indexes, backfills derived fields
+# and prints an explain() report for the hot queries.
+# Usage: python migrate_db.py [username-for-explain-report]
+import sys
+from utils import get_db, migrate_db, explain_hot_queries
+
+db = get_db()
+print(f"Backfilled {migrate_db(db)} task document(s).")
+
+username = sys.argv[1] if len(sys.argv) > 1 else (db["users"].find_one({}, {"username": 1}) or {}).get("username", "")
+print(f"\nQuery plans for user '{username}':")
+for row in explain_hot_queries(db, username):
+    status = "IXSCAN" if row["uses_index"] else "SCAN  "
+    print(f"  [{status}] {row['query']:<42} {', '.join(row['indexes']) or '-'}  ({' > '.join(row['stages'])})")
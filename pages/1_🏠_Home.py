@@ -3,20 +3,32 @@ import streamlit as st
 from datetime import date
 import pandas as pd
 from utils import (
-    apply_global_styles, build_sidebar, add_task, get_tasks, 
-    update_task_status, delete_task, update_task_details
+    apply_global_styles, build_sidebar, start_rerun_profile, end_rerun_profile, timed, get_banner, add_task, query_task_page, count_tasks, get_task_tags,
+    update_task_details, get_write_queue,
+    bulk_complete_tasks, bulk_reopen_tasks, bulk_delete_tasks, bulk_retag_tasks, bulk_reschedule_tasks
 )
 
 st.set_page_config(page_title="TaskFlow Home", page_icon="🏠", layout="wide")
-apply_global_styles(); build_sidebar()
+start_rerun_profile("Home"); apply_global_styles(); build_sidebar()
 if not st.session_state.get("login_state"):
     st.switch_page("taskflow_app.py")
 
 username = st.session_state.user
-era_banner_path = f"images/{st.session_state.era_mode}.png"
-st.image(era_banner_path, use_container_width=True)
+with timed("asset", "era_banner"): st.image(get_banner(st.session_state.era_mode), use_container_width=True)
 
 st.title("📝 Your Tasks")
+
+# --- Done/Undo/Delete go through the session's write-behind queue and show up before Mongo is written ---
+write_queue = get_write_queue()
+st.session_state.setdefault("write_failures", []).extend(write_queue.pop_failures())
+if st.session_state.write_failures:
+    st.error("Some changes couldn't be saved and were undone:\n" + "\n".join(f"- {f['action']} '{f['title']}': {f['error']}" for f in st.session_state.write_failures))
+    if st.button("Dismiss", key="dismiss_write_failures"): st.session_state.write_failures = []; st.rerun()
+def save_status():
+    if failures := write_queue.pop_failures(): st.session_state.write_failures.extend(failures); st.rerun(scope="app")
+    if depth := write_queue.depth(): st.caption(f"⏳ Saving {depth} change(s)…")
+st.fragment(run_every=1.0 if write_queue.depth() else None)(save_status)()
+def mark_done(task): write_queue.set_status(task, "Completed"); st.session_state[f"check_{task['_id']}"] = False
 with st.expander("➕ Add New Task", expanded=False):
     with st.form("new_task_form", clear_on_submit=True):
         col1, col2 = st.columns(2); title = col1.text_input("Task Description")
@@ -28,39 +40,79 @@ with st.expander("➕ Add New Task", expanded=False):
                 add_task(username, title, priority, due_date.isoformat(), tag_list)
                 st.rerun()
 st.markdown("---")
-all_tasks = get_tasks(username)
 st.subheader("Filter & Sort")
 f1, f2, f3, f4 = st.columns(4)
 filter_status = f1.selectbox("Filter by Status", ["All", "Pending", "Completed"])
-all_tags = sorted(list(set(tag for task in all_tasks for tag in task.get("tags", []))))
-filter_tag = f2.selectbox("Filter by Tag", ["All"] + all_tags)
+filter_tag = f2.selectbox("Filter by Tag", ["All"] + get_task_tags(username))
 search = f3.text_input("Search by Title")
 sort_order = f4.selectbox("Sort Priority", ["High to Low", "Low to High"])
+filters = (filter_status, filter_tag, search, sort_order)
+matches_filters = lambda t: (filter_tag == "All" or filter_tag in t.get("tags", [])) and search.lower() in t.get("title", "").lower()
+
+# --- Pagination: each list keeps a stack of keyset cursors, reset whenever the filters change ---
+def page_cursor(key):
+    if st.session_state.get(f"{key}_filters") != filters:
+        st.session_state[f"{key}_filters"] = filters; st.session_state[f"{key}_cursors"] = [None]
+    return st.session_state[f"{key}_cursors"][-1]
+def load_page(key, status):
+    tasks, next_cursor = query_task_page(username, status, filter_tag, search, sort_order, page_cursor(key))
+    cursors = st.session_state[f"{key}_cursors"]
+    tasks = write_queue.overlay(tasks, status, prepend=len(cursors) == 1, matches=matches_filters)
+    if not tasks and len(cursors) > 1: cursors.pop(); st.rerun() # Page emptied by a delete; step back.
+    return tasks, next_cursor
+def page_controls(key, next_cursor):
+    cursors = st.session_state[f"{key}_cursors"]
+    if len(cursors) == 1 and not next_cursor: return
+    prev_col, info_col, next_col = st.columns([1, 10, 1])
+    if prev_col.button("◀", key=f"{key}_prev", help="Previous Page", disabled=len(cursors) == 1): cursors.pop(); st.rerun()
+    info_col.caption(f"Page {len(cursors)}")
+    if next_col.button("▶", key=f"{key}_next", help="Next Page", disabled=not next_cursor): cursors.append(next_cursor); st.rerun()
 
-tasks_to_display = all_tasks
-if filter_status != "All": tasks_to_display = [t for t in tasks_to_display if t.get("status") == filter_status]
-if filter_tag != "All": tasks_to_display = [t for t in tasks_to_display if filter_tag in t.get("tags", [])]
-if search: tasks_to_display = [t for t in tasks_to_display if search.lower() in t.get("title", "").lower()]
-pending_tasks = [t for t in tasks_to_display if t.get("status") != 'Completed']
-completed_tasks = [t for t in tasks_to_display if t.get("status") == 'Completed']
+pending_tasks, pending_next = load_page("pending", "Pending") if filter_status != "Completed" else ([], None)
 
-# --- THIS IS THE FIX for the sorting logic ---
-priority_map = {"High": 0, "Medium": 1, "Low": 2}
-# When sorting High to Low, we want descending order of value, which is reverse=True.
-# But our map gives High=0, Low=2. So we sort normally (reverse=False) for High to Low.
-# And we sort in reverse for Low to High.
-should_reverse_sort = (sort_order == "Low to High")
-pending_tasks.sort(key=lambda x: priority_map.get(x['priority'], 1), reverse=should_reverse_sort)
-# --- END OF FIX ---
+# --- Bulk actions: one round trip for the ticked rows on this page, or for everything matching the filters ---
+def clear_selection():
+    for key in [k for k in st.session_state if str(k).startswith("sel_")]: del st.session_state[key]
+def run_bulk(action, *args, **target):
+    action(username, *args, **target); clear_selection(); st.rerun()
+def confirm_bulk_delete(key, count, **target):
+    # Deleting everything that matches the filters is permanent, so it takes a second click.
+    if st.session_state.get("confirm_delete") != key: return
+    st.warning(f"Permanently delete {count} task(s)? This can't be undone.")
+    yes_col, no_col, _ = st.columns([2, 2, 6])
+    if yes_col.button(f"🗑️ Delete {count} Task(s)", key=f"{key}_confirm", use_container_width=True): del st.session_state.confirm_delete; run_bulk(bulk_delete_tasks, **target)
+    if no_col.button("Cancel", key=f"{key}_cancel", use_container_width=True): del st.session_state.confirm_delete; st.rerun()
 
 st.subheader("Pending Tasks")
+if pending_tasks:
+    selected_ids = [str(t["_id"]) for t in pending_tasks if st.session_state.get(f"sel_{t['_id']}")]
+    with st.expander(f"☑️ Bulk Actions ({len(selected_ids)} selected)"):
+        pending_filter = {"status": "Pending", "tag": filter_tag, "search": search}
+        pending_count = count_tasks(username, **pending_filter)
+        scope = st.radio("Apply to", ["Selected tasks", f"All {pending_count} matching pending tasks"], horizontal=True)
+        target = {"task_ids": selected_ids} if scope == "Selected tasks" else {"task_filter": pending_filter}
+        nothing_selected = scope == "Selected tasks" and not selected_ids
+        b1, b2, b3, b4 = st.columns(4)
+        if b1.button("✅ Complete", use_container_width=True, disabled=nothing_selected): run_bulk(bulk_complete_tasks, **target)
+        if b1.button("🗑️ Delete", use_container_width=True, disabled=nothing_selected):
+            if scope == "Selected tasks": run_bulk(bulk_delete_tasks, **target)
+            st.session_state.confirm_delete = "pending"; st.rerun()
+        bulk_due = b2.date_input("New Due Date", min_value=date.today(), key="bulk_due")
+        if b2.button("📅 Reschedule", use_container_width=True, disabled=nothing_selected): run_bulk(bulk_reschedule_tasks, bulk_due.isoformat(), **target)
+        bulk_add_tags = b3.text_input("Add Tags (comma-separated)", key="bulk_add_tags")
+        bulk_remove_tags = b4.text_input("Remove Tags (comma-separated)", key="bulk_remove_tags")
+        if b3.button("🏷️ Retag", use_container_width=True, disabled=nothing_selected):
+            split_tags = lambda text: [tag.strip() for tag in text.split(",") if tag.strip()]
+            run_bulk(bulk_retag_tasks, split_tags(bulk_add_tags), split_tags(bulk_remove_tags), **target)
+    confirm_bulk_delete("pending", pending_count, task_filter=pending_filter)
 if not pending_tasks:
     st.info("No pending tasks match your filters. Great job! 🎉")
 else:
     for task in pending_tasks:
         task_id = str(task["_id"])
-        col_check, col_details, col_actions = st.columns([1, 10, 2])
-        col_check.checkbox("Done", key=f"check_{task_id}", value=False, on_change=update_task_status, args=(task_id, "Completed"))
+        col_select, col_check, col_details, col_actions = st.columns([1, 1, 10, 2])
+        col_select.checkbox("Select", key=f"sel_{task_id}", help="Select for Bulk Actions")
+        col_check.checkbox("Done", key=f"check_{task_id}", value=False, on_change=mark_done, args=(task,))
         with col_details:
             priority_icon = "🔴" if task['priority'] == 'High' else "🟠" if task['priority'] == 'Medium' else "🟢"
             tags_html = " ".join([f'<span class="tag" style="background-color: #eee; color: #333; padding: 2px 6px; border-radius: 5px; font-size: 0.8em;">{tag}</span>' for tag in task.get("tags", [])])
@@ -69,7 +121,7 @@ else:
             edit_col, delete_col = st.columns(2)
             if edit_col.button("✏️", key=f"edit_{task_id}", help="Edit Task"): st.session_state.editing_task_id = task_id; st.rerun()
             if delete_col.button("🗑️", key=f"del_{task_id}", help="Delete Task"):
-                delete_task(task_id); st.rerun()
+                write_queue.delete(task); st.rerun()
         if st.session_state.get("editing_task_id") == task_id:
             with st.expander("Edit Task", expanded=True):
                 with st.form(key=f"edit_form_{task_id}"):
@@ -80,15 +132,26 @@ else:
                     if save_col.form_submit_button("Save Changes", use_container_width=True): update_task_details(task_id, new_priority, new_due_date.isoformat(), new_tags); del st.session_state.editing_task_id; st.rerun()
                     if cancel_col.form_submit_button("Cancel", use_container_width=True): del st.session_state.editing_task_id; st.rerun()
         st.markdown("<hr style='margin-top: 0.5rem; margin-bottom: 0.5rem; opacity: 0.2;'>", unsafe_allow_html=True)
+    page_controls("pending", pending_next)
 
-if completed_tasks:
-    with st.expander(f"✅ Completed Tasks ({len(completed_tasks)})"):
+completed_count = count_tasks(username, "Completed", filter_tag, search) + write_queue.count_delta("Completed", matches_filters) if filter_status != "Pending" else 0
+if completed_count:
+    with st.expander(f"✅ Completed Tasks ({completed_count})"):
+        completed_filter = {"status": "Completed", "tag": filter_tag, "search": search}
+        reopen_col, clear_col, _ = st.columns([2, 2, 6])
+        if reopen_col.button("↩️ Reopen All", use_container_width=True, help="Mark every completed task matching the filters as pending"): run_bulk(bulk_reopen_tasks, task_filter=completed_filter)
+        if clear_col.button("🗑️ Delete All", use_container_width=True, help="Permanently delete every completed task matching the filters"): st.session_state.confirm_delete = "completed"; st.rerun()
+        confirm_bulk_delete("completed", completed_count, task_filter=completed_filter)
+        completed_tasks, completed_next = load_page("completed", "Completed")
         for task in completed_tasks:
             task_id = str(task["_id"]); col_undo, col_details, col_delete = st.columns([1, 10, 1])
             with col_undo:
                 if st.button("↩️", key=f"undo_{task_id}", help="Mark as Pending"):
-                    update_task_status(task_id, "Pending"); st.rerun()
+                    write_queue.set_status(task, "Pending"); st.rerun()
             with col_details: st.markdown(f"~~_{task['title']}_~~")
             with col_delete:
                  if st.button("🗑️", key=f"del_comp_{task_id}", help="Delete Task Permanently"):
-                    delete_task(task_id); st.rerun()
\ No newline at end of file
+                    write_queue.delete(task); st.rerun()
+        page_controls("completed", completed_next)
+
+end_rerun_profile()
@@ -1,10 +1,11 @@
 # pages/2_🗓️_Calendar.py
 import streamlit as st
+from datetime import date
 from streamlit_calendar import calendar
-from utils import apply_global_styles, build_sidebar, get_tasks, get_era_theme_config # Correct import
+from utils import apply_global_styles, build_sidebar, get_calendar_events, get_era_theme_config, start_rerun_profile, end_rerun_profile # Correct import
 
 st.set_page_config(page_title="TaskFlow Calendar", page_icon="🗓️", layout="wide")
-apply_global_styles(); build_sidebar()
+start_rerun_profile("Calendar"); apply_global_styles(); build_sidebar()
 if not st.session_state.get("login_state"):
     st.switch_page("taskflow_app.py")
 
@@ -34,20 +35,22 @@ st.markdown(f"<h1 class='themed-title'>🗓️ Task Calendar</h1>", unsafe_allow
 st.markdown("View all your tasks and their due dates in one place.")
 
 username = st.session_state.get("user", "")
-all_tasks = get_tasks(username)
-calendar_events = []
-for task in all_tasks:
-    priority_colors = {
-        "High": {"bg": "#ef5350", "border": "#d32f2f", "text": "#ffffff"},
-        "Medium": {"bg": "#ffca28", "border": "#ffb300", "text": "#424242"},
-        "Low": {"bg": "#66bb6a", "border": "#43a047", "text": "#ffffff"}
-    }
-    colors = priority_colors.get(task.get('priority', 'Medium'))
-    calendar_events.append({
-        "title": f"📌 {task['title']}", "start": task['due_date'], "end": task['due_date'],
-        "backgroundColor": colors['bg'], "borderColor": colors['border'], "textColor": colors['text'],
-        "allDay": True,
-    })
-
-calendar_options = {"headerToolbar": {"left": "prev,next today", "center": "title", "right": "dayGridMonth,timeGridWeek,timeGridDay"}}
-calendar(events=calendar_events, options=calendar_options)
\ No newline at end of file
+
+# --- Visible month lives in session state; only that month's window of tasks is loaded ---
+def shift_month(month, delta):
+    index = month.year * 12 + month.month - 1 + delta
+    return date(index // 12, index % 12 + 1, 1)
+if "calendar_month" not in st.session_state: st.session_state.calendar_month = date.today().replace(day=1)
+prev_col, today_col, next_col, _ = st.columns([1, 1, 1, 9])
+if prev_col.button("◀", help="Previous Month", use_container_width=True): st.session_state.calendar_month = shift_month(st.session_state.calendar_month, -1)
+if today_col.button("Today", use_container_width=True): st.session_state.calendar_month = date.today().replace(day=1)
+if next_col.button("▶", help="Next Month", use_container_width=True): st.session_state.calendar_month = shift_month(st.session_state.calendar_month, 1)
+visible_month = st.session_state.calendar_month
+
+calendar_events = get_calendar_events(username, visible_month)
+calendar_options = {"initialView": "dayGridMonth", "initialDate": visible_month.isoformat(), "headerToolbar": {"left": "", "center": "title", "right": ""}}
+# The component's own navigation and week/day views are hidden: the buttons above own the month, so the
+# component always shows exactly the loaded window and the page never has to follow its view.
+calendar(events=calendar_events, options=calendar_options, key=f"calendar_{visible_month:%Y_%m}")
+
+end_rerun_profile()
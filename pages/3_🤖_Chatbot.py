@@ -1,15 +1,15 @@
 # pages/3_🤖_Chatbot.py
 import streamlit as st
 import openai
-import json
 from datetime import date
 from utils import (
-    apply_global_styles, build_sidebar, add_task, get_tasks, 
-    update_task_by_title, delete_task_by_title
+    apply_global_styles, build_sidebar, start_rerun_profile, end_rerun_profile, add_task, get_tasks, 
+    update_task_by_title, delete_task_by_title, TurnTimer, stream_completion, run_tool_calls, build_context, handle_fast_path,
+    get_response_cache, response_cache_key, bulk_update_tasks, BULK_ACTIONS
 )
 
 st.set_page_config(page_title="TaskFlow Assistant", page_icon="🤖", layout="wide")
-apply_global_styles(); build_sidebar()
+start_rerun_profile("Chatbot"); apply_global_styles(); build_sidebar()
 if not st.session_state.get("login_state"):
     st.switch_page("taskflow_app.py")
 
@@ -21,7 +21,7 @@ if "confirmation_message" in st.session_state:
     del st.session_state.confirmation_message
 
 try:
-    client = openai.OpenAI(api_key=st.secrets["openai"]["api_key"])
+    client = openai.OpenAI(api_key=st.secrets["openai"]["api_key"], base_url=st.secrets["openai"].get("base_url")) # base_url points at a local OpenAI-compatible server for testing
 except (KeyError, FileNotFoundError):
     st.error("OpenAI API key not found.", icon="🚨"); st.stop()
 
@@ -29,63 +29,81 @@ tools = [
     {"type": "function", "function": {"name": "get_tasks", "description": "Get a list of all of the user's tasks.", "parameters": {"type": "object", "properties": {}}}},
     {"type": "function", "function": {"name": "add_task", "description": "Add a new task. Today's date is " + str(date.today()), "parameters": {"type": "object", "properties": {"title": {"type": "string"}, "priority": {"type": "string", "enum": ["High", "Medium", "Low"]}, "due_date": {"type": "string", "description": "YYYY-MM-DD format."}, "tags": {"type": "array", "items": {"type": "string"}}}, "required": ["title", "due_date"]}}},
     {"type": "function", "function": {"name": "update_task_by_title", "description": "Update a task's status, priority, due date, or tags.", "parameters": {"type": "object", "properties": {"title": {"type": "string"}, "new_status": {"type": "string", "enum": ["Pending", "Completed"]}, "new_priority": {"type": "string", "enum": ["High", "Medium", "Low"]}, "new_due_date": {"type": "string"}, "new_tags": {"type": "array", "items": {"type": "string"}}}, "required": ["title"]}}},
+    {"type": "function", "function": {"name": "bulk_update_tasks", "description": "Apply one action to many tasks in a single call, e.g. 'complete everything tagged Shopping' or 'move all pending work tasks to Friday'. Select tasks by tag, status, title search and/or exact titles. A delete without confirm only reports how many tasks would be deleted. Today's date is " + str(date.today()), "parameters": {"type": "object", "properties": {"action": {"type": "string", "enum": list(BULK_ACTIONS)}, "tag": {"type": "string"}, "status": {"type": "string", "enum": ["Pending", "Completed"]}, "search": {"type": "string", "description": "Substring of the task titles."}, "titles": {"type": "array", "items": {"type": "string"}}, "add_tags": {"type": "array", "items": {"type": "string"}}, "remove_tags": {"type": "array", "items": {"type": "string"}}, "new_due_date": {"type": "string", "description": "YYYY-MM-DD format, for reschedule."}, "confirm": {"type": "boolean", "description": "Only for delete: set to true after the user has confirmed the number of tasks to delete."}}, "required": ["action"]}}},
     {"type": "function", "function": {"name": "delete_task_by_title", "description": "Delete a task by its title, with optional filters.", "parameters": {"type": "object", "properties": {"title": {"type": "string"},"priority": {"type": "string", "enum": ["High", "Medium", "Low"]}, "tags": {"type": "array", "items": {"type": "string"}}}, "required": ["title"]}}},
 ]
-available_functions = {"get_tasks": get_tasks, "add_task": add_task, "update_task_by_title": update_task_by_title, "delete_task_by_title": delete_task_by_title}
+available_functions = {"get_tasks": get_tasks, "add_task": add_task, "update_task_by_title": update_task_by_title, "delete_task_by_title": delete_task_by_title, "bulk_update_tasks": bulk_update_tasks}
+write_functions = {"add_task", "update_task_by_title", "delete_task_by_title", "bulk_update_tasks"}
+read_only_functions = {"get_tasks"}
+response_cache = get_response_cache()
+
+def call_tool(function_name, function_args):
+    function_args["username"] = st.session_state.user
+    if function_name == "add_task": function_args.setdefault("priority", "Medium"); function_args.setdefault("tags", [])
+    return available_functions[function_name](**function_args)
+def format_metrics(metrics):
+    if metrics.get("fast_path"): return f"⚡ answered locally in {metrics['total'] * 1000:.0f} ms"
+    if metrics.get("cached"): return f"♻️ cached answer in {metrics['total'] * 1000:.0f} ms · cache hit rate {metrics['cache_hit_rate']:.0%}"
+    return f"⏱️ first token {metrics['ttft']:.2f}s · total {metrics['total']:.2f}s · {metrics['tool_calls']} tool call(s) · {metrics.get('context_tokens', 0)} context tokens ({metrics.get('tokens_saved', 0)} saved)"
 
 if "messages" not in st.session_state:
     st.session_state.messages = [{"role": "assistant", "content": "Hello! How can I help you manage your tasks today?"}]
 
+def render_content(content):
+    if isinstance(content, list):
+        if len(content) > 0:
+            formatted_list = [f"- **{item['title']}** (Priority: {item.get('priority', 'N/A')}, Due: {item.get('due_date', 'N/A')})" for item in content]
+            st.markdown("\n".join(formatted_list))
+        else:
+            st.markdown("I couldn't find any tasks that match.")
+    else:
+        st.markdown(str(content))
+
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
-        content = message["content"];
-        if isinstance(content, list):
-            if len(content) > 0:
-                formatted_list = [f"- **{item['title']}** (Priority: {item.get('priority', 'N/A')}, Due: {item.get('due_date', 'N/A')})" for item in content]
-                st.markdown("\n".join(formatted_list))
-            else:
-                st.markdown("I couldn't find any tasks that match.")
-        else:
-            st.markdown(str(content))
+        render_content(message["content"])
+        if "metrics" in message: st.caption(format_metrics(message["metrics"]))
 
 if prompt := st.chat_input("Ask your assistant..."):
     st.session_state.messages.append({"role": "user", "content": prompt})
     with st.chat_message("user"): st.markdown(prompt)
 
     with st.chat_message("assistant"):
-        message_placeholder = st.empty()
-        with st.spinner("Thinking..."):
-            try:
-                base_messages = [{"role": m["role"], "content": str(m["content"])} for m in st.session_state.messages]
-                response = client.chat.completions.create(model="gpt-3.5-turbo", messages=base_messages, tools=tools, tool_choice="auto")
-                response_message = response.choices[0].message; tool_calls = response_message.tool_calls
+        message_placeholder = st.empty(); message_placeholder.markdown("Thinking...")
+        show_partial = lambda text: message_placeholder.markdown(text + "▌")
+        try:
+            timer = TurnTimer()
+            fast_path = handle_fast_path(st.session_state.user, prompt) # Obvious commands skip the model entirely
+            cache_key = response_cache_key(st.session_state.user, prompt); cached_response = None if fast_path else response_cache.get(cache_key)
+            if fast_path:
+                timer.tool_calls += 1; timer.mark_token()
+                full_response = fast_path["content"]; needs_data_refresh = fast_path["write"]
+                with message_placeholder.container(): render_content(full_response)
+            elif cached_response is not None:
+                timer.mark_token(); full_response = cached_response; needs_data_refresh = False
+                message_placeholder.markdown(full_response)
+            else:
+                base_messages = build_context(st.session_state.messages, timer)
+                full_response, tool_calls = stream_completion(client, base_messages, show_partial, timer, tools=tools, tool_choice="auto")
+                needs_data_refresh = False
                 if tool_calls:
-                    base_messages.append(response_message)
-                    needs_data_refresh = False
-                    for tool_call in tool_calls:
-                        function_name = tool_call.function.name
-                        function_to_call = available_functions[function_name]
-                        function_args = json.loads(tool_call.function.arguments)
-                        function_args["username"] = st.session_state.user
-                        if function_name in ["add_task", "update_task_by_title", "delete_task_by_title"]:
-                            needs_data_refresh = True
-                        if function_name == "add_task": function_args.setdefault("priority", "Medium"); function_args.setdefault("tags", [])
-                        function_response = function_to_call(**function_args)
-                        base_messages.append({"tool_call_id": tool_call.id, "role": "tool", "name": function_name, "content": str(function_response)})
-                    
-                    second_response = client.chat.completions.create(model="gpt-3.5-turbo", messages=base_messages)
-                    full_response = second_response.choices[0].message.content
-                    message_placeholder.markdown(full_response)
-                    st.session_state.messages.append({"role": "assistant", "content": full_response})
-                    
-                    if needs_data_refresh:
-                        st.session_state.confirmation_message = full_response
-                        st.rerun() # Rerun the current page to refresh sidebar and show toast
-                else:
-                    full_response = response.choices[0].message.content
-                    message_placeholder.markdown(full_response)
-                    st.session_state.messages.append({"role": "assistant", "content": full_response})
-            except openai.RateLimitError:
-                st.error("API quota exceeded."); st.stop()
-            except Exception as e:
-                st.error(f"An error occurred: {e}"); st.stop()
\ No newline at end of file
+                    base_messages.append({"role": "assistant", "content": full_response or None, "tool_calls": tool_calls})
+                    base_messages += run_tool_calls(tool_calls, call_tool, timer, read_only=tuple(read_only_functions))
+                    needs_data_refresh = any(call["function"]["name"] in write_functions for call in tool_calls)
+                    full_response, _ = stream_completion(client, base_messages, show_partial, timer)
+                    # The key carries the task-data version read before the turn, so a concurrent write can't be cached over.
+                    if all(call["function"]["name"] in read_only_functions for call in tool_calls): response_cache.put(cache_key, full_response)
+                message_placeholder.markdown(full_response)
+            metrics = {**timer.summary(), "fast_path": bool(fast_path), "cached": cached_response is not None, "cache_hit_rate": response_cache.stats()["hit_rate"]}
+            st.caption(format_metrics(metrics))
+            st.session_state.messages.append({"role": "assistant", "content": full_response, "metrics": metrics})
+
+            if needs_data_refresh:
+                st.session_state.confirmation_message = full_response
+                st.rerun() # Rerun the current page to refresh sidebar and show toast
+        except openai.RateLimitError:
+            st.error("API quota exceeded."); st.stop()
+        except Exception as e:
+            st.error(f"An error occurred: {e}"); st.stop()
+
+end_rerun_profile()
@@ -1,6 +1,6 @@
 # taskflow_app.py
 import streamlit as st
-from utils import apply_global_styles, build_sidebar, create_user, authenticate_user
+from utils import apply_global_styles, build_sidebar, create_user, authenticate_user, start_rerun_profile, end_rerun_profile, get_banner
 
 # STEP 1: Restore the original, working page configuration
 st.set_page_config(
@@ -9,7 +9,7 @@ st.set_page_config(
     layout="wide"  # Use 'wide' layout to correctly center the form with columns
 )
 
-apply_global_styles()
+start_rerun_profile("Login"); apply_global_styles()
 
 
 # --- PRIMARY LOGIC: REDIRECT OR SHOW LOGIN ---
@@ -34,7 +34,7 @@ _ , login_col, _ = st.columns([1, 1, 1])
 
 with login_col:
     # Your original, preferred login UI
-    st.image("images/login_banner.png")
+    st.image(get_banner("login_banner", 650))
     st.markdown("<h1 style='text-align: center;'>🔐 TaskFlow Login</h1>", unsafe_allow_html=True)
 
     login_tab, signup_tab = st.tabs(["Login", "Sign Up"])
@@ -74,4 +74,5 @@ with login_col:
                     else:
                         st.error(result)
 
-# The old "Welcome Page" else block is gone. The script now ends here for a non-logged-in user.
\ No newline at end of file
+# The old "Welcome Page" else block is gone. The script now ends here for a non-logged-in user.
+end_rerun_profile()
@@ -1,16 +1,111 @@
 # utils.py
 import streamlit as st
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, UpdateMany, DeleteMany
+from pymongo.errors import OperationFailure, PyMongoError
 from bson.objectid import ObjectId
 from datetime import date, datetime, timedelta
+from collections import OrderedDict
 import re
+import threading
+import time
+import json
+import os
+import io
+import functools
+import uuid
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from PIL import Image
 
-# --- DB and User Functions (Unchanged) ---
+# --- Instrumentation ---
+# Process-wide call counts, latency histograms, documents returned and tokens used for the DB helpers (@timed("db")),
+# model calls ("llm") and page reruns ("rerun"). Recording is a lock and a few additions, cheap enough to leave on.
+# TASKFLOW_METRICS_FILE makes a background thread rewrite a Prometheus text file (node_exporter textfile collector
+# format); ?debug=1 in the URL or TASKFLOW_DEBUG_PANEL=1 shows the sidebar debug panel.
+METRICS_FILE = os.environ.get("TASKFLOW_METRICS_FILE"); METRICS_EXPORT_INTERVAL = 15.0
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_KINDS = ("db", "llm", "asset")
+_profile = threading.local() # per script thread: the rerun being profiled and the @timed nesting depth
+class Metrics:
+    def __init__(self): self._lock = threading.Lock(); self._series = {}
+    def record(self, kind: str, name: str, seconds: float, docs: int = 0, tokens_in: int = 0, tokens_out: int = 0, error: bool = False):
+        with self._lock:
+            series = self._series.get((kind, name))
+            if series is None: series = self._series[(kind, name)] = {"count": 0, "errors": 0, "seconds": 0.0, "max": 0.0, "docs": 0, "tokens_in": 0, "tokens_out": 0, "buckets": [0] * (len(METRIC_BUCKETS) + 1)}
+            series["count"] += 1; series["errors"] += error; series["seconds"] += seconds; series["max"] = max(series["max"], seconds)
+            series["docs"] += docs; series["tokens_in"] += tokens_in; series["tokens_out"] += tokens_out; series["buckets"][bisect_left(METRIC_BUCKETS, seconds)] += 1
+    def snapshot(self) -> list:
+        with self._lock: return [{"kind": kind, "name": name, **series, "buckets": list(series["buckets"])} for (kind, name), series in sorted(self._series.items())]
+def _export_metrics(metrics: Metrics, path: str):
+    while True:
+        time.sleep(METRICS_EXPORT_INTERVAL)
+        try:
+            with open(path + ".tmp", "w") as f: f.write(render_prometheus(metrics))
+            os.replace(path + ".tmp", path) # scrapers never see a half-written file
+        except OSError as e: print(f"Metrics export to {path} failed: {e}")
 @st.cache_resource
-def get_mongo_client(): MONGO_URI = st.secrets["mongo"]["uri"]; client = MongoClient(MONGO_URI); return client
-def get_db(): client = get_mongo_client(); return client["taskflow_db"]
+def get_metrics():
+    metrics = Metrics()
+    if METRICS_FILE: threading.Thread(target=_export_metrics, args=(metrics, METRICS_FILE), daemon=True, name="taskflow-metrics-exporter").start()
+    return metrics
+def _count_docs(result) -> int:
+    if isinstance(result, tuple): result = next((part for part in result if isinstance(part, list)), None) # (page, cursor), (task, candidates)
+    return len(result) if isinstance(result, list) else int(isinstance(result, dict))
+def record_metric(kind: str, name: str, seconds: float, nested: bool = False, **fields):
+    get_metrics().record(kind, name, seconds, **fields)
+    current = getattr(_profile, "current", None)
+    if current is not None and not nested and kind in current: # nested calls are already inside their caller's time
+        totals = current[kind]; totals["seconds"] += seconds; totals["calls"] += 1; totals["docs"] += fields.get("docs", 0); totals["tokens"] += fields.get("tokens_in", 0) + fields.get("tokens_out", 0)
+class timed:
+    # `@timed("db")` on a function, or `with timed("asset", "era_banner"):` around a block.
+    def __init__(self, kind: str, name: str = None): self.kind = kind; self.name = name; self.docs = 0
+    def __enter__(self):
+        self._depth = getattr(_profile, "depth", 0); _profile.depth = self._depth + 1; self._started = time.perf_counter(); return self
+    def __exit__(self, exc_type, exc, tb):
+        _profile.depth = self._depth; record_metric(self.kind, self.name, time.perf_counter() - self._started, nested=self._depth > 0, docs=self.docs, error=exc_type is not None)
+    def __call__(self, fn):
+        kind, name = self.kind, self.name or fn.__name__
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(kind, name) as timing: result = fn(*args, **kwargs); timing.docs = _count_docs(result); return result
+        return wrapper
+def start_rerun_profile(page: str):
+    # Call first thing in a page script, and end_rerun_profile() as its last line. Runs cut short by st.rerun()
+    # or st.stop() are not recorded; DB calls made on other threads (tool pool, write queue) are not attributed.
+    _profile.current = {"page": page, "started": time.perf_counter(), **{kind: {"seconds": 0.0, "calls": 0, "docs": 0, "tokens": 0} for kind in PROFILE_KINDS}}
+def end_rerun_profile():
+    current = getattr(_profile, "current", None); _profile.current = None
+    if current is None: return
+    total = time.perf_counter() - current.pop("started"); record_metric("rerun", current["page"], total)
+    st.session_state.last_rerun_profile = {**current, "total": total}
+def _label(value) -> str: return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+def render_prometheus(metrics: Metrics = None) -> str:
+    snapshot = (metrics or get_metrics()).snapshot(); lines = []
+    def family(metric, kind, help_text): lines.extend([f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"])
+    family("taskflow_operation_duration_seconds", "histogram", "Wall time of instrumented DB helpers, model calls and page reruns.")
+    for row in snapshot:
+        labels = f'kind="{_label(row["kind"])}",name="{_label(row["name"])}"'; cumulative = 0
+        for bound, count in zip(METRIC_BUCKETS + ("+Inf",), row["buckets"]):
+            cumulative += count; lines.append(f'taskflow_operation_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines += [f"taskflow_operation_duration_seconds_sum{{{labels}}} {row['seconds']:.6f}", f"taskflow_operation_duration_seconds_count{{{labels}}} {row['count']}"]
+    family("taskflow_operation_errors_total", "counter", "Instrumented calls that raised.")
+    lines += [f'taskflow_operation_errors_total{{kind="{_label(r["kind"])}",name="{_label(r["name"])}"}} {r["errors"]}' for r in snapshot]
+    family("taskflow_documents_returned_total", "counter", "Documents (tasks, events, tags) returned by DB helpers.")
+    lines += [f'taskflow_documents_returned_total{{name="{_label(r["name"])}"}} {r["docs"]}' for r in snapshot if r["kind"] == "db"]
+    family("taskflow_llm_tokens_total", "counter", "Tokens used by model calls.")
+    for r in (r for r in snapshot if r["kind"] == "llm"):
+        lines += [f'taskflow_llm_tokens_total{{model="{_label(r["name"])}",type="prompt"}} {r["tokens_in"]}', f'taskflow_llm_tokens_total{{model="{_label(r["name"])}",type="completion"}} {r["tokens_out"]}']
+    return "\n".join(lines) + "\n"
+
+# --- DB and User Functions ---
+DB_NAME = "taskflow_db"
+@st.cache_resource
+def get_mongo_client(): MONGO_URI = st.secrets["mongo"]["uri"]; client = MongoClient(MONGO_URI); bootstrap_db(client[DB_NAME]); return client
+def get_db(): client = get_mongo_client(); return client[DB_NAME]
 def get_tasks_collection(): db = get_db(); return db["tasks"]
 def get_users_collection(): db = get_db(); return db["users"]
+@timed("db")
 def create_user(username, password):
     users_col = get_users_collection();
     if len(username) < 3: return "Username must be at least 3 characters long."
@@ -18,46 +113,847 @@ def create_user(username, password):
     if not re.match("^[a-zA-Z0-9_]+$", username): return "Username can only contain letters, numbers, and underscores."
     if users_col.find_one({"username": username}): return "Username already exists."
     users_col.insert_one({"username": username, "password": password}); return True
+@timed("db")
 def authenticate_user(username, password):
     users_col = get_users_collection(); user_data = users_col.find_one({"username": username})
     if user_data and user_data["password"] == password: return user_data
     return None
-@st.cache_data
+
+# --- Schema, Indexes and Migrations ---
+# Bump SCHEMA_VERSION when adding indexes or backfilled fields; bootstrap_db() then re-runs once.
+SCHEMA_VERSION = 5
+def normalize_title(title: str) -> str: return " ".join(str(title).split()).casefold()
+def ensure_indexes(db):
+    db["users"].create_index("username", unique=True, name="username_unique")
+    db["users"].create_index("tasks_updated_at", name="tasks_updated_at") # polled by CacheWatcher on standalone servers
+    tasks_col = db["tasks"]
+    tasks_col.create_index([("username", 1), ("status", 1), ("due_date", 1)], name="username_status_due")
+    tasks_col.create_index([("username", 1), ("tags", 1)], name="username_tags")
+    tasks_col.create_index([("username", 1), ("title_normalized", 1)], name="username_title")
+    tasks_col.create_index([("username", 1), ("due_date", 1)], name="username_due")
+    tasks_col.create_index([("username", 1), ("status", 1), ("priority_rank", 1), ("_id", 1)], name="username_status_rank") # serves query_task_page's sort and cursor
+    try: db.command({"collMod": "tasks", "changeStreamPreAndPostImages": {"enabled": True}}) # lets CacheWatcher see who owned a deleted task
+    except OperationFailure: pass # needs MongoDB 6.0+
+def bootstrap_db(db):
+    # Called once per process from get_mongo_client(); create_index is a no-op for existing indexes.
+    meta = db["meta"].find_one({"_id": "schema"}) or {}
+    if meta.get("indexes_version", 0) >= SCHEMA_VERSION: return
+    try: ensure_indexes(db)
+    except OperationFailure as e: print(f"Index bootstrap failed, run `python migrate_db.py`: {e}"); return
+    backfill_title_normalized(db) # resolve_task_title looks exact titles up on the stored normalized form
+    backfill_priority_rank(db) # query_task_page sorts on the stored rank, so unranked tasks would sort first
+    db["meta"].update_one({"_id": "schema"}, {"$set": {"indexes_version": SCHEMA_VERSION}}, upsert=True)
+def migrate_db(db, batch_size: int = 1000):
+    ensure_indexes(db); backfilled = backfill_title_normalized(db, batch_size) + backfill_priority_rank(db)
+    db["meta"].update_one({"_id": "schema"}, {"$set": {"indexes_version": SCHEMA_VERSION, "data_version": SCHEMA_VERSION, "migrated_at": datetime.utcnow()}}, upsert=True)
+    return backfilled
+def backfill_title_normalized(db, batch_size: int = 1000):
+    tasks_col = db["tasks"]; backfilled = 0; batch = []
+    for task in tasks_col.find({"title_normalized": {"$exists": False}}, {"title": 1}):
+        batch.append(UpdateOne({"_id": task["_id"]}, {"$set": {"title_normalized": normalize_title(task.get("title", ""))}}))
+        if len(batch) >= batch_size: backfilled += tasks_col.bulk_write(batch, ordered=False).modified_count; batch = []
+    if batch: backfilled += tasks_col.bulk_write(batch, ordered=False).modified_count
+    return backfilled
+def backfill_priority_rank(db):
+    # One update_many per priority; unknown or missing priorities sort as Medium, like the list views show them.
+    tasks_col = db["tasks"]; missing = {"priority_rank": {"$exists": False}}
+    backfilled = sum(tasks_col.update_many({**missing, "priority": priority}, {"$set": {"priority_rank": rank}}).modified_count for priority, rank in PRIORITY_RANK.items())
+    return backfilled + tasks_col.update_many(missing, {"$set": {"priority_rank": PRIORITY_RANK["Medium"]}}).modified_count
+def _plan_stages(plan):
+    # Flattens an explain() winning plan (classic or SBE layout) into (stage, indexName) pairs.
+    if isinstance(plan, list): return [s for p in plan for s in _plan_stages(p)]
+    if not isinstance(plan, dict): return []
+    stages = [(plan["stage"], plan.get("indexName"))] if "stage" in plan else []
+    return stages + [s for key, value in plan.items() if key not in ("stage", "indexName") for s in _plan_stages(value)]
+def explain_hot_queries(db, username: str):
+    today = date.today().isoformat()
+    hot_queries = {
+        "users.find_one(username)": (db["users"], {"username": username}),
+        "tasks.find(username)": (db["tasks"], {"username": username}),
+        "tasks.find(username, status)": (db["tasks"], {"username": username, "status": {"$ne": "Completed"}}),
+        "tasks.find(username, status, due_date)": (db["tasks"], {"username": username, "status": "Pending", "due_date": {"$lt": today}}),
+        "tasks.find(username, due_date range)": (db["tasks"], {"username": username, "due_date": {"$gte": today, "$lt": "9999"}}),
+        "tasks.find(username, tags)": (db["tasks"], {"username": username, "tags": "Work"}),
+        "tasks.find(username, title_normalized)": (db["tasks"], {"username": username, "title_normalized": "call mom"}),
+        "tasks.find(username, status).sort(priority_rank)": (db["tasks"], {"username": username, "status": "Pending"}, [("priority_rank", 1), ("_id", 1)]),
+    }
+    report = []
+    for name, (col, query, *sort) in hot_queries.items():
+        cursor = col.find(query).sort(sort[0]) if sort else col.find(query)
+        stages = _plan_stages(cursor.explain().get("queryPlanner", {}).get("winningPlan", {}))
+        indexes = sorted({index for _, index in stages if index})
+        report.append({"query": name, "uses_index": bool(indexes) and all(stage != "COLLSCAN" for stage, _ in stages), "indexes": indexes, "stages": [stage for stage, _ in stages]})
+    return report
+
+# --- Task Cache ---
+# Per-user task lists shared by every session in this process. Write helpers patch the
+# affected user's list in place instead of dropping the cache for everyone.
+TASK_CACHE_MAX_USERS = 512; TASK_CACHE_MAX_DERIVED = 2048; TASK_CACHE_MAX_OWNERS = 50000
+# Bounds how stale a derived value can get when another replica deletes a task whose owner this process can't
+# name (no pre-images before MongoDB 6.0, and the task was never loaded here).
+TASK_CACHE_DERIVED_TTL = 60.0
+
+class TaskCache:
+    def __init__(self, max_users: int = TASK_CACHE_MAX_USERS, max_derived: int = TASK_CACHE_MAX_DERIVED):
+        self.max_users = max_users; self.max_derived = max_derived; self.hits = 0; self.misses = 0; self.evictions = 0; self.unresolved_deletes = 0
+        self._entries = OrderedDict(); self._versions = {}; self._derived = OrderedDict(); self._lock = threading.RLock()
+        self._owners = OrderedDict() # task id -> username for tasks seen here, to route remote deletes that don't name their owner
+        self.on_write = None; self.watcher = None # on_write(username) runs after every local write; both set by get_task_cache()
+
+    def version(self, username: str) -> int:
+        with self._lock: return self._versions.get(username, 0)
+
+    def get(self, username: str):
+        with self._lock:
+            tasks = self._entries.get(username)
+            if tasks is None: self.misses += 1; return None
+            self._entries.move_to_end(username); self.hits += 1; return list(tasks)
+
+    def peek(self, username: str):
+        # Like get(), without touching LRU order or hit counters; for derived values that can skip a query.
+        with self._lock: tasks = self._entries.get(username); return None if tasks is None else list(tasks)
+
+    def put(self, username: str, tasks: list, version: int):
+        # A write that landed while `tasks` was being read from Mongo bumps the version; drop the stale read.
+        with self._lock:
+            if self._versions.get(username, 0) != version: return
+            self._entries[username] = list(tasks); self._entries.move_to_end(username); self._remember(username, (t["_id"] for t in tasks))
+            while len(self._entries) > self.max_users: self._entries.popitem(last=False); self.evictions += 1
+
+    def _remember(self, username: str, task_ids):
+        with self._lock:
+            for task_id in task_ids: self._owners[task_id] = username; self._owners.move_to_end(task_id)
+            while len(self._owners) > TASK_CACHE_MAX_OWNERS: self._owners.popitem(last=False)
+
+    def get_derived(self, username: str, key):
+        # Values computed from a user's tasks (stats, calendar months) stay valid until that user's next write,
+        # and at most TASK_CACHE_DERIVED_TTL seconds.
+        with self._lock:
+            entry = self._derived.get((username, key))
+            if entry is None or entry[0] != self._versions.get(username, 0) or time.monotonic() - entry[2] > TASK_CACHE_DERIVED_TTL: return None
+            self._derived.move_to_end((username, key)); return entry[1]
+
+    def put_derived(self, username: str, key, value, version: int):
+        with self._lock:
+            if self._versions.get(username, 0) != version: return
+            self._derived[(username, key)] = (version, value, time.monotonic()); self._derived.move_to_end((username, key))
+            while len(self._derived) > self.max_derived: self._derived.popitem(last=False)
+
+    def _patch(self, username: str, fn, local: bool = True):
+        with self._lock:
+            self._versions[username] = self._versions.get(username, 0) + 1
+            tasks = self._entries.get(username)
+            if tasks is not None: self._entries[username] = fn(tasks)
+        if local and self.on_write: self.on_write(username)
+
+    def insert(self, username: str, task: dict): self._remember(username, [task["_id"]]); self._patch(username, lambda tasks: tasks + [task])
+    # local=False skips on_write, for optimistic patches whose database write (and stamp) comes later.
+    def update(self, username: str, task_id, fields: dict, local: bool = True):
+        self._patch(username, lambda tasks: [{**t, **fields} if t["_id"] == task_id else t for t in tasks], local)
+    def remove(self, username: str, task_id, local: bool = True): self.remove_many(username, [task_id], local)
+    def patch_many(self, username: str, task_ids, fn):
+        task_ids = set(task_ids); self._patch(username, lambda tasks: [fn(t) if t["_id"] in task_ids else t for t in tasks])
+    def remove_many(self, username: str, task_ids, local: bool = True):
+        task_ids = set(task_ids); self._remember(username, task_ids) # routes the change-stream echoes of these deletes
+        self._patch(username, lambda tasks: [t for t in tasks if t["_id"] not in task_ids], local)
+
+    # Changes made by other processes, applied by the CacheWatcher.
+    def upsert_remote(self, task: dict):
+        def replace(tasks):
+            replaced = [task if t["_id"] == task["_id"] else t for t in tasks]
+            return replaced if any(t["_id"] == task["_id"] for t in tasks) else tasks + [task]
+        self._remember(task["username"], [task["_id"]]); self._patch(task["username"], replace, local=False)
+    def remove_remote(self, task_id, username: str = None):
+        with self._lock:
+            username = username or self._owners.get(task_id)
+            owners = [username] if username else [name for name, tasks in self._entries.items() if any(t["_id"] == task_id for t in tasks)]
+            # Never seen here, so no cached list holds it; derived values catch up within TASK_CACHE_DERIVED_TTL.
+            if not owners: self.unresolved_deletes += 1; return
+        for owner in owners: self._patch(owner, lambda tasks: [t for t in tasks if t["_id"] != task_id], local=False)
+
+    def invalidate(self, username: str = None, derived_only: bool = False):
+        with self._lock:
+            usernames = [username] if username else set(self._entries) | set(self._versions) | {name for name, _ in self._derived}
+            for name in usernames:
+                if not derived_only: self._entries.pop(name, None)
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"users": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions, "unresolved_deletes": self.unresolved_deletes,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+@st.cache_resource
+def get_task_cache(): cache = TaskCache(); cache.watcher = CacheWatcher(get_mongo_client()[DB_NAME], cache).start(); return cache
+def get_task_cache_stats(): cache = get_task_cache(); return {**cache.stats(), "watcher": cache.watcher.stats()}
+
+# --- Cross-Process Cache Coherence ---
+# Every replica keeps its own TaskCache, so each one runs a watcher thread. On a replica set it tails a
+# change stream on `tasks` and patches or evicts only the affected users. A standalone mongod has no
+# change streams, so there the write helpers stamp users.tasks_updated_at (and tasks_updated_by, this
+# watcher's writer id) and the watcher polls it, skipping its own stamps.
+CACHE_POLL_INTERVAL = 2.0
+class CacheWatcher:
+    def __init__(self, db, cache: TaskCache, poll_interval: float = CACHE_POLL_INTERVAL):
+        self.db = db; self.cache = cache; self.poll_interval = poll_interval; self.mode = None; self.events = 0; self.resumes = 0
+        self._stream = None; self._resume_token = None; self._stop = threading.Event()
+        self.writer_id = uuid.uuid4().hex; self._since = None # newest tasks_updated_at this watcher has seen
+
+    def _open_stream(self):
+        options = {"full_document": "updateLookup", "resume_after": self._resume_token}
+        try: return self.db["tasks"].watch(full_document_before_change="whenAvailable", **options) # pre-images name the owner of deleted tasks (MongoDB 6.0+)
+        except OperationFailure: return self.db["tasks"].watch(**options)
+
+    def start(self):
+        try: self._stream = self._open_stream(); self.mode = "change_stream"
+        except PyMongoError: # standalone mongod
+            self.mode = "poll"; self.cache.on_write = self.touch_user
+        threading.Thread(target=self._watch if self.mode == "change_stream" else self._poll, name="taskflow-cache-watcher", daemon=True).start()
+        return self
+
+    def stop(self): self._stop.set()
+
+    def apply_change(self, change: dict):
+        self.events += 1; operation = change["operationType"]
+        if operation in ("insert", "replace", "update"):
+            if change.get("fullDocument"): self.cache.upsert_remote(change["fullDocument"])
+            else: self.cache.remove_remote(change["documentKey"]["_id"]) # deleted again before the lookup ran
+        elif operation == "delete":
+            before = change.get("fullDocumentBeforeChange") or {}
+            self.cache.remove_remote(change["documentKey"]["_id"], before.get("username"))
+        else: self.cache.invalidate() # drop, rename, invalidate, ...
+
+    def _watch(self):
+        while not self._stop.is_set():
+            try:
+                if self._stream is None: self._stream = self._open_stream()
+                with self._stream as stream:
+                    for change in stream:
+                        self._resume_token = stream.resume_token; self.apply_change(change)
+                        if self._stop.is_set(): return
+                self._stream = None
+            except PyMongoError as e:
+                print(f"Cache watcher lost its change stream, resuming: {e}"); self.resumes += 1; self._stream = None
+                # Server-side errors (e.g. resume point no longer in the oplog) mean events may have been missed.
+                if isinstance(e, OperationFailure) or self._resume_token is None: self._resume_token = None; self.cache.invalidate()
+                self._stop.wait(self.poll_interval)
+
+    def touch_user(self, username: str):
+        previous = self.db["users"].find_one_and_update({"username": username}, {"$currentDate": {"tasks_updated_at": True}, "$set": {"tasks_updated_by": self.writer_id}},
+                                                        {"tasks_updated_at": 1, "tasks_updated_by": 1}) or {}
+        # Our stamp replaces one from another process that the poll hasn't seen yet; act on that change now.
+        if previous.get("tasks_updated_by") not in (None, self.writer_id) and (self._since is None or previous["tasks_updated_at"] > self._since):
+            self.events += 1; self.cache.invalidate(username)
+
+    def _poll(self):
+        while True:
+            try:
+                if self._since is None:
+                    latest = self.db["users"].find_one({"tasks_updated_at": {"$exists": True}}, {"tasks_updated_at": 1}, sort=[("tasks_updated_at", -1)])
+                    self._since = latest["tasks_updated_at"] if latest else datetime(1970, 1, 1)
+                else:
+                    # Own stamps are skipped: the local write already patched this process's cache in place.
+                    for user in self.db["users"].find({"tasks_updated_at": {"$gt": self._since}}, {"username": 1, "tasks_updated_at": 1, "tasks_updated_by": 1}):
+                        self._since = max(self._since, user["tasks_updated_at"])
+                        if user.get("tasks_updated_by") != self.writer_id: self.events += 1; self.cache.invalidate(user["username"])
+            except PyMongoError as e: print(f"Cache watcher poll failed: {e}")
+            if self._stop.wait(self.poll_interval): return
+
+    def stats(self) -> dict: return {"mode": self.mode, "events": self.events, "resumes": self.resumes}
+
+# --- Task Functions ---
+@timed("db")
 def get_tasks(username: str):
-    print(f"CACHE MISS: Fetching tasks for {username} from DB.")
-    tasks_col = get_tasks_collection(); return list(tasks_col.find({"username": username}))
+    cache = get_task_cache(); tasks = cache.get(username)
+    if tasks is not None: return tasks
+    version = cache.version(username); tasks = list(get_tasks_collection().find({"username": username}))
+    cache.put(username, tasks, version); return list(tasks)
+@timed("db")
 def add_task(username: str, title: str, priority: str, due_date: str, tags: list, status: str = "Pending"):
-    tasks_col = get_tasks_collection(); tasks_col.insert_one({"username": username, "title": title, "status": status, "priority": priority, "due_date": due_date, "tags": tags, "created_at": datetime.utcnow()})
-    get_tasks.clear(); return f"Task '{title}' was successfully added."
-def update_task_status(task_id: str, new_status: str):
-    tasks_col = get_tasks_collection(); tasks_col.update_one({"_id": ObjectId(task_id)}, {"$set": {"status": new_status}}); get_tasks.clear()
+    tasks_col = get_tasks_collection(); task = {"username": username, "title": title, "title_normalized": normalize_title(title), "status": status, **priority_fields(priority), "due_date": due_date, "tags": tags, "created_at": datetime.utcnow()}
+    tasks_col.insert_one(task); get_task_cache().insert(username, task); return f"Task '{title}' was successfully added."
+def _apply_task_update(task_id: str, fields: dict):
+    tasks_col = get_tasks_collection(); task = tasks_col.find_one_and_update({"_id": ObjectId(task_id)}, {"$set": fields}, projection={"username": 1})
+    if task: get_task_cache().update(task["username"], task["_id"], fields)
+@timed("db")
+def update_task_status(task_id: str, new_status: str): _apply_task_update(task_id, {"status": new_status})
+@timed("db")
 def delete_task(task_id: str):
-    tasks_col = get_tasks_collection(); tasks_col.delete_one({"_id": ObjectId(task_id)}); get_tasks.clear()
+    tasks_col = get_tasks_collection(); task = tasks_col.find_one_and_delete({"_id": ObjectId(task_id)}, projection={"username": 1})
+    if task: get_task_cache().remove(task["username"], task["_id"])
+@timed("db")
 def update_task_details(task_id: str, new_priority: str, new_due_date: str, new_tags: list):
-    tasks_col = get_tasks_collection(); tasks_col.update_one({"_id": ObjectId(task_id)}, {"$set": {"priority": new_priority, "due_date": new_due_date, "tags": new_tags}}); get_tasks.clear()
+    _apply_task_update(task_id, {**priority_fields(new_priority), "due_date": new_due_date, "tags": new_tags})
+# --- Title Resolution ---
+# Chatbot tools refer to tasks by title. Exact (normalized) titles resolve with one lookup on the
+# (username, title_normalized) index. Otherwise nothing is written: the user's titles are ranked by
+# substring/trigram overlap and returned as "Did you mean" candidates ("call mom" must never hit "Call dad").
+# Only non-destructive edits may act on a title that is the single substring match.
+TITLE_MATCH_THRESHOLD = 0.35; TITLE_SUBSTRING_SCORE = 0.9
+TITLE_LOOKUP_PROJECTION = {"title": 1, "title_normalized": 1, "tags": 1}
+def _trigrams(text: str): padded = f"  {text} "; return {padded[i:i + 3] for i in range(len(padded) - 2)}
+def title_similarity(a: str, b: str) -> float:
+    a_grams, b_grams = _trigrams(a), _trigrams(b); union = a_grams | b_grams
+    return len(a_grams & b_grams) / len(union) if union else 0.0
+@timed("db")
+def resolve_task_title(username: str, title: str, extra_filter: dict = None, allow_substring: bool = False):
+    # Returns (task, candidates): `task` is the exact match (or, with allow_substring, the only title containing
+    # `title`) or None; `candidates` are the ranked near-misses to offer back to the user.
+    tasks_col = get_tasks_collection(); query = {"username": username, **(extra_filter or {})}; wanted = normalize_title(title)
+    exact = list(tasks_col.find({**query, "title_normalized": wanted}, TITLE_LOOKUP_PROJECTION, limit=2))
+    if exact: return (exact[0] if len(exact) == 1 else None), exact
+    scored = []; exact = []
+    for task in tasks_col.find(query, TITLE_LOOKUP_PROJECTION):
+        candidate = task.get("title_normalized") or normalize_title(task.get("title", ""))
+        if candidate == wanted: exact.append(task); continue # not backfilled yet
+        score = TITLE_SUBSTRING_SCORE if wanted and wanted in candidate else title_similarity(wanted, candidate)
+        if score >= TITLE_MATCH_THRESHOLD: scored.append((score, task))
+    if exact: return (exact[0] if len(exact) == 1 else None), exact
+    scored.sort(key=lambda pair: pair[0], reverse=True); candidates = [task for _, task in scored[:5]]
+    substring_matches = [task for score, task in scored if score == TITLE_SUBSTRING_SCORE]
+    return (substring_matches[0] if allow_substring and len(substring_matches) == 1 else None), candidates
+def _quoted_titles(tasks): return ", ".join(f'"{t["title"]}"' for t in tasks)
+def _unresolved_title_error(title: str, candidates: list) -> str:
+    if all(normalize_title(t["title"]) == normalize_title(title) for t in candidates): return f"Error: I found several tasks titled '{title}': {_quoted_titles(candidates)}. Please be more specific."
+    return f"Error: I couldn't find a task titled exactly '{title}'. Did you mean: {_quoted_titles(candidates)}?"
+@timed("db")
 def update_task_by_title(username: str, title: str, new_status: str = None, new_priority: str = None, new_due_date: str = None, new_tags: list = None):
-    tasks_col = get_tasks_collection(); query = {"username": username, "title": {"$regex": f"^{title}$", "$options": "i"}}; task_to_update = tasks_col.find_one(query)
-    if not task_to_update: return f"Error: I couldn't find a task with the exact title '{title}'."
-    update_data = {};
+    # Status changes need the exact title; priority/due date/tag edits may use an unambiguous partial title.
+    tasks_col = get_tasks_collection(); task_to_update, candidates = resolve_task_title(username, title, allow_substring=not new_status)
+    if not task_to_update:
+        if candidates: return _unresolved_title_error(title, candidates)
+        return f"Error: I couldn't find a task with the exact title '{title}'."
+    title = task_to_update["title"]; update_data = {};
     if new_status: update_data["status"] = new_status
-    if new_priority: update_data["priority"] = new_priority
+    if new_priority: update_data.update(priority_fields(new_priority))
     if new_due_date: update_data["due_date"] = new_due_date
     if new_tags is not None: updated_tags = sorted(list(set(task_to_update.get("tags", [])) | set(new_tags))); update_data["tags"] = updated_tags
     if not update_data: return "You didn't specify what to change."
-    result = tasks_col.update_one(query, {"$set": update_data}); get_tasks.clear()
-    if result.modified_count > 0: return f"Successfully updated the task: '{title}'."
+    result = tasks_col.update_one({"_id": task_to_update["_id"]}, {"$set": update_data})
+    if result.modified_count > 0: get_task_cache().update(username, task_to_update["_id"], update_data); return f"Successfully updated the task: '{title}'."
     else: return f"The task '{title}' already had these properties. No update was necessary."
+@timed("db")
 def delete_task_by_title(username: str, title: str, priority: str = None, tags: list = None):
-    tasks_col = get_tasks_collection(); query = {"username": username, "title": {"$regex": title, "$options": "i"}}
-    if priority: query["priority"] = priority
-    if tags: query["tags"] = {"$in": tags}
-    matching_tasks = list(tasks_col.find(query))
-    if not matching_tasks: return f"Error: I couldn't find any task matching all those criteria (title: '{title}', priority: {priority}, tags: {tags})."
-    if len(matching_tasks) > 1: return f"Error: I found multiple tasks that still match: {', '.join([f'\"{t["title"]}\"' for t in matching_tasks])}. Please be more specific."
-    task_to_delete = matching_tasks[0]; tasks_col.delete_one({"_id": task_to_delete["_id"]}); get_tasks.clear()
+    tasks_col = get_tasks_collection(); extra_filter = {}
+    if priority: extra_filter["priority"] = priority
+    if tags: extra_filter["tags"] = {"$in": tags}
+    task_to_delete, candidates = resolve_task_title(username, title, extra_filter)
+    if not candidates: return f"Error: I couldn't find any task matching all those criteria (title: '{title}', priority: {priority}, tags: {tags})."
+    if not task_to_delete: return _unresolved_title_error(title, candidates)
+    tasks_col.delete_one({"_id": task_to_delete["_id"]}); get_task_cache().remove(username, task_to_delete["_id"])
     return f"Successfully deleted the task: '{task_to_delete['title']}'."
 
-# --- Theme and CSS (Unchanged) ---
+# --- Task Queries ---
+# Server-side filter/sort/pagination for list views. Pages are keyset-paginated on the stored
+# (priority_rank, _id), walking the username_status_rank index, so each rerun reads one page.
+TASK_PAGE_SIZE = 25
+PRIORITY_RANK = {"High": 0, "Medium": 1, "Low": 2}; TASK_STATUSES = ("Pending", "Completed")
+def priority_fields(priority: str) -> dict: return {"priority": priority, "priority_rank": PRIORITY_RANK.get(priority, PRIORITY_RANK["Medium"])}
+TASK_LIST_PROJECTION = {"title": 1, "status": 1, "priority": 1, "due_date": 1, "tags": 1}
+def build_task_filter(username: str, status: str = "All", tag: str = "All", search: str = ""):
+    query = {"username": username}
+    if status == "Completed": query["status"] = "Completed"
+    elif status == "Pending": query["status"] = "Pending"
+    if tag and tag != "All": query["tags"] = tag
+    if search: query["title"] = {"$regex": re.escape(search), "$options": "i"}
+    return query
+@timed("db")
+def query_task_page(username: str, status: str = "All", tag: str = "All", search: str = "", sort_order: str = "High to Low", cursor: dict = None, page_size: int = TASK_PAGE_SIZE):
+    # _id sorts in the same direction as the rank so one index scan (forward or backward) yields the page in order.
+    direction = -1 if sort_order == "Low to High" else 1; op = "$gt" if direction == 1 else "$lt"
+    query = build_task_filter(username, status, tag, search)
+    if "status" not in query: query["status"] = {"$in": list(TASK_STATUSES)} # point bounds let the planner merge-sort both statuses
+    if cursor: query["$or"] = [{"priority_rank": {op: cursor["rank"]}}, {"priority_rank": cursor["rank"], "_id": {op: ObjectId(cursor["id"])}}]
+    tasks = list(get_tasks_collection().find(query, {**TASK_LIST_PROJECTION, "priority_rank": 1}).sort([("priority_rank", direction), ("_id", direction)]).limit(page_size + 1))
+    next_cursor = None
+    if len(tasks) > page_size:
+        tasks = tasks[:page_size]; next_cursor = {"rank": tasks[-1]["priority_rank"], "id": str(tasks[-1]["_id"])}
+    return tasks, next_cursor
+@timed("db")
+def count_tasks(username: str, status: str = "All", tag: str = "All", search: str = ""):
+    return get_tasks_collection().count_documents(build_task_filter(username, status, tag, search))
+@timed("db")
+def get_task_tags(username: str): return sorted(t for t in get_tasks_collection().distinct("tags", {"username": username}) if t)
+
+# --- Bulk Operations ---
+# Each bulk action is one bulk_write round trip over an id list (or the ids matching a filter) and one
+# in-place patch of the user's cached task list.
+BULK_BATCH_SIZE = 1000
+BULK_ACTIONS = ("complete", "reopen", "delete", "retag", "reschedule")
+def _bulk_target_ids(username: str, task_ids: list = None, task_filter: dict = None):
+    if task_ids is not None and not task_filter: return [ObjectId(i) for i in task_ids]
+    query = build_task_filter(username, **(task_filter or {}))
+    if task_ids is not None: query["_id"] = {"$in": [ObjectId(i) for i in task_ids]}
+    return [t["_id"] for t in get_tasks_collection().find(query, {"_id": 1})]
+def _bulk_write(username: str, ids: list, make_ops):
+    ops = [op for i in range(0, len(ids), BULK_BATCH_SIZE) for op in make_ops({"username": username, "_id": {"$in": ids[i:i + BULK_BATCH_SIZE]}})]
+    return get_tasks_collection().bulk_write(ops, ordered=True) if ops else None
+def _bulk_set(username: str, fields: dict, task_ids: list = None, task_filter: dict = None):
+    ids = _bulk_target_ids(username, task_ids, task_filter); result = _bulk_write(username, ids, lambda query: [UpdateMany(query, {"$set": fields})])
+    if result: get_task_cache().patch_many(username, ids, lambda t: {**t, **fields})
+    return result.modified_count if result else 0
+@timed("db")
+def bulk_complete_tasks(username: str, task_ids: list = None, task_filter: dict = None): return _bulk_set(username, {"status": "Completed"}, task_ids, task_filter)
+@timed("db")
+def bulk_reopen_tasks(username: str, task_ids: list = None, task_filter: dict = None): return _bulk_set(username, {"status": "Pending"}, task_ids, task_filter)
+@timed("db")
+def bulk_reschedule_tasks(username: str, new_due_date: str, task_ids: list = None, task_filter: dict = None): return _bulk_set(username, {"due_date": new_due_date}, task_ids, task_filter)
+@timed("db")
+def bulk_delete_tasks(username: str, task_ids: list = None, task_filter: dict = None):
+    ids = _bulk_target_ids(username, task_ids, task_filter); result = _bulk_write(username, ids, lambda query: [DeleteMany(query)])
+    if result: get_task_cache().remove_many(username, ids)
+    return result.deleted_count if result else 0
+@timed("db")
+def bulk_retag_tasks(username: str, add_tags: list = None, remove_tags: list = None, task_ids: list = None, task_filter: dict = None):
+    add_tags = [t for t in add_tags or [] if t]; remove_tags = [t for t in remove_tags or [] if t]
+    def make_ops(query):
+        ops = [UpdateMany(query, {"$addToSet": {"tags": {"$each": add_tags}}})] if add_tags else []
+        return ops + ([UpdateMany(query, {"$pull": {"tags": {"$in": remove_tags}}})] if remove_tags else [])
+    def retag(task):
+        tags = task.get("tags", []); tags = tags + [t for t in add_tags if t not in tags]
+        return {**task, "tags": [t for t in tags if t not in remove_tags]}
+    # Only tasks missing an added tag or holding a removed one are written, so the count is what actually changed.
+    needs_change = [{"tags": {"$ne": tag}} for tag in add_tags] + ([{"tags": {"$in": remove_tags}}] if remove_tags else [])
+    ids = _bulk_target_ids(username, task_ids, task_filter)
+    if not ids or not needs_change: return 0
+    ids = [t["_id"] for t in get_tasks_collection().find({"username": username, "_id": {"$in": ids}, "$or": needs_change}, {"_id": 1})]
+    result = _bulk_write(username, ids, make_ops)
+    if result: get_task_cache().patch_many(username, ids, retag)
+    return len(ids) if result else 0
+@timed("db")
+def bulk_update_tasks(username: str, action: str, tag: str = None, status: str = None, search: str = None, titles: list = None,
+                      add_tags: list = None, remove_tags: list = None, new_due_date: str = None, confirm: bool = False):
+    # Chatbot entry point: selects tasks by filters and/or exact titles and returns a reply string. Deletes only
+    # report the match count until called again with confirm=True, like Home's second "Confirm delete" click.
+    if action not in BULK_ACTIONS: return f"Error: Unknown bulk action '{action}'."
+    if not (tag or status or search or titles): return "Error: Please say which tasks to change (a tag, status, title search or list of titles)."
+    task_filter = {"status": status or "All", "tag": tag or "All", "search": search or ""}; task_ids = None
+    if titles:
+        matches = get_tasks_collection().find({"username": username, "title_normalized": {"$in": [normalize_title(t) for t in titles]}}, {"_id": 1})
+        task_ids = [str(t["_id"]) for t in matches]
+        if not task_ids: return f"Error: I couldn't find any tasks titled {_quoted_titles([{'title': t} for t in titles])}."
+    if action == "complete": count = bulk_complete_tasks(username, task_ids, task_filter)
+    elif action == "reopen": count = bulk_reopen_tasks(username, task_ids, task_filter)
+    elif action == "delete" and not confirm:
+        count = len(_bulk_target_ids(username, task_ids, task_filter))
+        if not count: return "No matching tasks to delete."
+        return f"This would permanently delete {count} task(s). Ask the user to confirm, then call bulk_update_tasks again with the same selection and confirm: true."
+    elif action == "delete": count = bulk_delete_tasks(username, task_ids, task_filter)
+    elif action == "reschedule":
+        if not new_due_date: return "Error: Please give the new due date."
+        count = bulk_reschedule_tasks(username, new_due_date, task_ids, task_filter)
+    else:
+        if not (add_tags or remove_tags): return "Error: Please say which tags to add or remove."
+        count = bulk_retag_tasks(username, add_tags, remove_tags, task_ids, task_filter)
+    past_tense = {"complete": "Completed", "reopen": "Reopened", "delete": "Deleted", "retag": "Retagged", "reschedule": "Rescheduled"}[action]
+    return f"{past_tense} {count} task(s)." if count else "No matching tasks needed changing."
+
+# --- Write-Behind Queue ---
+# Home's Done/Undo/Delete clicks are applied to the shared TaskCache (and so to stats, calendar and chatbot reads)
+# as soon as they are queued, and written to Mongo by a background worker.
+# Within WRITE_BEHIND_DELAY, repeated changes to one task collapse to the final intent (toggling back and
+# forth writes nothing); each flush is at most three bulk writes. Failed writes are retried, then reported and
+# the user's cached list is dropped so the next read reloads what Mongo actually holds.
+WRITE_BEHIND_DELAY = 0.5; WRITE_BEHIND_MAX_ATTEMPTS = 3
+class WriteBehindQueue:
+    def __init__(self, username: str):
+        self.username = username; self._pending = OrderedDict(); self._inflight = {}; self._failures = []
+        self._lock = threading.Lock(); self._worker = None; self._ctx = get_script_run_ctx()
+        self.flushes = 0; self.writes = 0; self.coalesced = 0; self.failed = 0; self.last_flush_ms = 0.0; self.total_flush_ms = 0.0
+
+    def _intended_status(self, task_id: str, current_status: str):
+        op = self._pending.get(task_id) or self._inflight.get(task_id)
+        return op["status"] if op else current_status
+
+    def _load_cached_list(self):
+        # The optimistic patches need the user's list in the TaskCache; a freshly loaded list gets the queued changes replayed.
+        cache = get_task_cache()
+        if cache.peek(self.username) is not None: return
+        get_tasks(self.username)
+        with self._lock: ops = {**self._inflight, **self._pending}
+        for task_id, op in ops.items(): self._patch_cache(task_id, op["status"])
+
+    def _patch_cache(self, task_id: str, status: str):
+        if status: get_task_cache().update(self.username, ObjectId(task_id), {"status": status}, local=False)
+        else: get_task_cache().remove(self.username, ObjectId(task_id), local=False)
+
+    def set_status(self, task: dict, new_status: str):
+        task_id = str(task["_id"]); self._load_cached_list()
+        with self._lock:
+            queued = self._pending.get(task_id)
+            if queued and queued["op"] == "delete": return
+            original = queued["original"] if queued else self._intended_status(task_id, task.get("status", "Pending"))
+            self._patch_cache(task_id, new_status)
+            if queued and new_status == original: del self._pending[task_id]; self.coalesced += 2; return # toggled back
+            self._pending[task_id] = {"op": "status", "status": new_status, "original": original, "task": task, "attempts": 0}
+            self._ensure_worker()
+
+    def delete(self, task: dict):
+        task_id = str(task["_id"]); self._load_cached_list()
+        with self._lock:
+            queued = self._pending.get(task_id); original = queued["original"] if queued else task.get("status", "Pending")
+            self.coalesced += 1 if queued else 0; self._patch_cache(task_id, None)
+            self._pending[task_id] = {"op": "delete", "status": None, "original": original, "task": task, "attempts": 0}
+            self._ensure_worker()
+
+    def overlay(self, tasks: list, status: str, prepend: bool = False, matches=None):
+        # Applies queued intents to one page of `status`'s list; with `prepend`, tasks moving into it (and passing `matches`) are added on top.
+        with self._lock: ops = {**self._inflight, **self._pending}
+        shown = [{**t, "status": status} for t in tasks if str(t["_id"]) not in ops or ops[str(t["_id"])]["status"] == status]
+        if not prepend: return shown
+        shown_ids = {str(t["_id"]) for t in shown}
+        return [{**op["task"], "status": status} for task_id, op in ops.items() if op["status"] == status and task_id not in shown_ids and (matches is None or matches(op["task"]))] + shown
+
+    def count_delta(self, status: str, matches=None) -> int:
+        with self._lock: ops = [op for op in {**self._inflight, **self._pending}.values() if matches is None or matches(op["task"])]
+        return sum(op["status"] == status for op in ops if op["original"] != status) - sum(op["original"] == status for op in ops if op["status"] != status)
+
+    def pop_failures(self) -> list:
+        with self._lock: failures, self._failures = self._failures, []
+        return failures
+
+    def depth(self) -> int:
+        with self._lock: return len(self._pending) + len(self._inflight)
+
+    def _ensure_worker(self):
+        # Caller holds the lock. The worker exits once the queue drains, so idle sessions hold no thread.
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name=f"taskflow-write-behind-{self.username}", daemon=True)
+            add_script_run_ctx(self._worker, self._ctx); self._worker.start()
+
+    def _run(self):
+        while True:
+            time.sleep(WRITE_BEHIND_DELAY); self.flush()
+            with self._lock:
+                if not self._pending: self._worker = None; return
+
+    def flush(self):
+        with self._lock: batch = dict(self._pending); self._pending.clear(); self._inflight.update(batch)
+        if not batch: return
+        started = time.perf_counter()
+        plans = [(bulk_delete_tasks, [i for i, op in batch.items() if op["op"] == "delete"]),
+                 (bulk_complete_tasks, [i for i, op in batch.items() if op["status"] == "Completed"]),
+                 (bulk_reopen_tasks, [i for i, op in batch.items() if op["status"] == "Pending"])]
+        for action, task_ids in plans:
+            if not task_ids: continue
+            try: action(self.username, task_ids); self.writes += len(task_ids)
+            except PyMongoError as e: self._retry_or_fail(task_ids, batch, e)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            for task_id in batch: self._inflight.pop(task_id, None)
+            self.flushes += 1; self.last_flush_ms = elapsed_ms; self.total_flush_ms += elapsed_ms
+
+    def _retry_or_fail(self, task_ids: list, batch: dict, error: Exception):
+        with self._lock:
+            for task_id in task_ids:
+                if task_id in self._pending: continue # a newer click superseded this write
+                op = batch[task_id]; op["attempts"] += 1
+                if op["attempts"] < WRITE_BEHIND_MAX_ATTEMPTS: self._pending[task_id] = op; continue
+                self.failed += 1; self._failures.append({"title": op["task"].get("title", task_id), "action": "delete" if op["op"] == "delete" else f"mark {op['status'].lower()}", "error": str(error)})
+        if self._failures: get_task_cache().invalidate(self.username) # reverts the optimistic change
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"depth": len(self._pending) + len(self._inflight), "flushes": self.flushes, "writes": self.writes, "coalesced": self.coalesced, "failed": self.failed,
+                    "last_flush_ms": self.last_flush_ms, "avg_flush_ms": self.total_flush_ms / self.flushes if self.flushes else 0.0}
+def get_write_queue() -> WriteBehindQueue:
+    if "write_queue" not in st.session_state or st.session_state.write_queue.username != st.session_state.user:
+        st.session_state.write_queue = WriteBehindQueue(st.session_state.user)
+    return st.session_state.write_queue
+
+# --- Task Stats ---
+# Sidebar counters come from one $group aggregation per user (or the cached task list, which already holds queued
+# write-behind changes), cached until that user's next write or the next day.
+def _count_if(*conditions): return {"$sum": {"$cond": [{"$and": list(conditions)} if len(conditions) > 1 else conditions[0], 1, 0]}}
+@timed("db")
+def get_task_stats(username: str):
+    cache = get_task_cache(); today = date.today().isoformat(); stats = cache.get_derived(username, ("stats", today))
+    if stats is not None: return stats
+    version = cache.version(username); tasks = cache.peek(username)
+    if tasks is not None: stats = _stats_from_tasks(tasks, today); cache.put_derived(username, ("stats", today), stats, version); return stats
+    pending = {"$ne": ["$status", "Completed"]}
+    group = {"_id": None, "total": {"$sum": 1}, "completed": _count_if({"$eq": ["$status", "Completed"]}),
+             "overdue": _count_if(pending, {"$lt": ["$due_date", today]}), "due_today": _count_if(pending, {"$eq": ["$due_date", today]})}
+    for priority in PRIORITY_RANK: group[f"pending_{priority.lower()}"] = _count_if(pending, {"$eq": ["$priority", priority]})
+    result = next(get_tasks_collection().aggregate([{"$match": {"username": username}}, {"$group": group}]), {})
+    stats = {key: result.get(key, 0) for key in group if key != "_id"}; stats["pending"] = stats["total"] - stats["completed"]
+    cache.put_derived(username, ("stats", today), stats, version); return stats
+
+def _stats_from_tasks(tasks: list, today: str):
+    pending = [t for t in tasks if t.get("status") != "Completed"]
+    stats = {"total": len(tasks), "completed": len(tasks) - len(pending), "overdue": sum(t.get("due_date", "") < today for t in pending),
+             "due_today": sum(t.get("due_date") == today for t in pending), "pending": len(pending)}
+    for priority in PRIORITY_RANK: stats[f"pending_{priority.lower()}"] = sum(t.get("priority") == priority for t in pending)
+    return stats
+
+# --- Calendar Events ---
+# The calendar only loads tasks due inside the visible month grid (plus a margin), cached per (user, month);
+# a cached task list is filtered in memory instead.
+CALENDAR_PREFETCH_DAYS = 7
+CALENDAR_PRIORITY_COLORS = {
+    "High": {"bg": "#ef5350", "border": "#d32f2f", "text": "#ffffff"},
+    "Medium": {"bg": "#ffca28", "border": "#ffb300", "text": "#424242"},
+    "Low": {"bg": "#66bb6a", "border": "#43a047", "text": "#ffffff"}
+}
+def get_calendar_window(month: date):
+    # Month grids start on the Sunday on/before the 1st and span six weeks.
+    first = month.replace(day=1); grid_start = first - timedelta(days=(first.weekday() + 1) % 7)
+    return grid_start - timedelta(days=CALENDAR_PREFETCH_DAYS), grid_start + timedelta(days=42 + CALENDAR_PREFETCH_DAYS)
+@timed("db")
+def get_calendar_events(username: str, month: date):
+    cache = get_task_cache(); key = ("calendar", month.strftime("%Y-%m")); events = cache.get_derived(username, key)
+    if events is not None: return events
+    version = cache.version(username); window_start, window_end = get_calendar_window(month)
+    query = {"username": username, "due_date": {"$gte": window_start.isoformat(), "$lt": window_end.isoformat()}}
+    tasks = cache.peek(username); events = []
+    if tasks is not None: tasks = [t for t in tasks if window_start.isoformat() <= t.get("due_date", "") < window_end.isoformat()]
+    for task in tasks if tasks is not None else get_tasks_collection().find(query, {"_id": 0, "title": 1, "priority": 1, "due_date": 1}):
+        colors = CALENDAR_PRIORITY_COLORS.get(task.get('priority', 'Medium'), CALENDAR_PRIORITY_COLORS["Medium"])
+        events.append({
+            "title": f"📌 {task['title']}", "start": task['due_date'], "end": task['due_date'],
+            "backgroundColor": colors['bg'], "borderColor": colors['border'], "textColor": colors['text'],
+            "allDay": True,
+        })
+    cache.put_derived(username, key, events, version); return events
+
+# --- Assistant Streaming and Tool Execution ---
+ASSISTANT_MODEL = "gpt-3.5-turbo"; TOOL_WORKERS = 4
+class TurnTimer:
+    # Per-turn latency: time to the first visible token and total wall time, plus call counts.
+    def __init__(self): self.started = time.perf_counter(); self.first_token_at = None; self.model_calls = 0; self.tool_calls = 0; self.context_tokens = 0; self.tokens_saved = 0
+    def mark_token(self):
+        if self.first_token_at is None: self.first_token_at = time.perf_counter()
+    def summary(self) -> dict:
+        total = time.perf_counter() - self.started
+        return {"ttft": (self.first_token_at - self.started) if self.first_token_at else total, "total": total, "model_calls": self.model_calls, "tool_calls": self.tool_calls,
+                "context_tokens": self.context_tokens, "tokens_saved": self.tokens_saved}
+def stream_completion(client, messages: list, on_text, timer: TurnTimer, **kwargs):
+    # Streams one chat completion, calling on_text(text_so_far) as tokens arrive. Tool-call deltas are
+    # reassembled by index. Returns (content, tool_calls) with tool_calls in the API's dict form.
+    timer.model_calls += 1; content = ""; tool_calls = {}; usage = None; started = time.perf_counter(); failed = True
+    try:
+        stream = client.chat.completions.create(model=ASSISTANT_MODEL, messages=messages, stream=True, stream_options={"include_usage": True}, **kwargs)
+        for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage # the final chunk carries usage and no choices
+            if not chunk.choices: continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                timer.mark_token(); content += delta.content; on_text(content)
+            for call in delta.tool_calls or []:
+                entry = tool_calls.setdefault(call.index, {"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+                if call.id: entry["id"] = call.id
+                if call.function and call.function.name: entry["function"]["name"] += call.function.name
+                if call.function and call.function.arguments: entry["function"]["arguments"] += call.function.arguments
+        failed = False
+    finally:
+        # Servers that ignore stream_options send no usage; fall back to the same estimate build_context uses.
+        tokens_in = usage.prompt_tokens if usage else sum(estimate_tokens(str(m.get("content") or "")) for m in messages)
+        tokens_out = usage.completion_tokens if usage else estimate_tokens(content + json.dumps(tool_calls)) if content or tool_calls else 0
+        record_metric("llm", ASSISTANT_MODEL, time.perf_counter() - started, tokens_in=tokens_in, tokens_out=tokens_out, error=failed)
+    return content, [tool_calls[i] for i in sorted(tool_calls)]
+def run_tool_calls(tool_calls: list, call_tool, timer: TurnTimer = None, read_only: tuple = ("get_tasks",)):
+    # Writes naming different task titles run concurrently on a thread pool and writes to the same title run in order.
+    # A write without a single title (bulk_update_tasks) could touch any task, so then all writes run in one ordered
+    # group. Read-only calls run after every write, so they see the turn's changes.
+    # call_tool(name, args) returns the tool result. Returns the tool messages in the original call order.
+    parsed = [(position, call, json.loads(call["function"]["arguments"] or "{}")) for position, call in enumerate(tool_calls)]
+    writes = [entry for entry in parsed if entry[1]["function"]["name"] not in read_only]
+    reads = [[entry] for entry in parsed if entry[1]["function"]["name"] in read_only]
+    if all("title" in args for _, _, args in writes):
+        groups = {}
+        for entry in writes: groups.setdefault(normalize_title(entry[2]["title"]), []).append(entry)
+        write_groups = list(groups.values())
+    else: write_groups = [writes]
+    def run_group(group): return [(position, call, call_tool(call["function"]["name"], args)) for position, call, args in group]
+    ctx = get_script_run_ctx(); results = []
+    with ThreadPoolExecutor(max_workers=min(TOOL_WORKERS, max(len(write_groups), len(reads))) or 1, initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)) as pool:
+        for phase in (write_groups, reads): results += [r for group_results in pool.map(run_group, phase) for r in group_results]
+    results.sort(key=lambda r: r[0])
+    if timer: timer.tool_calls += len(results); timer.tokens_saved += sum(estimate_tokens(str(response)) - estimate_tokens(format_tool_result(response)) for _, _, response in results)
+    return [{"tool_call_id": call["id"], "role": "tool", "name": call["function"]["name"], "content": format_tool_result(response)} for _, call, response in results]
+
+# --- Assistant Context ---
+# Keeps each request under a token budget: recent messages go verbatim, older ones are folded into a
+# one-line-per-message summary, and task lists are sent as compact JSON with only the fields the model needs.
+CONTEXT_TOKEN_BUDGET = 2000; CONTEXT_RECENT_MESSAGES = 6; CONTEXT_SUMMARY_CHARS = 120
+TOOL_TASK_FIELDS = ("title", "status", "priority", "due_date", "tags")
+def estimate_tokens(text: str) -> int: return len(text) // 4 + 1 # ~4 characters per token for English text
+def format_tool_result(result) -> str:
+    if isinstance(result, list) and all(isinstance(item, dict) for item in result):
+        return json.dumps([{field: task[field] for field in TOOL_TASK_FIELDS if field in task} for task in result], default=str, separators=(",", ":"))
+    return str(result)
+def _summarize_message(message: dict) -> str:
+    content = message["content"]
+    if isinstance(content, list): text = f"listed {len(content)} task(s): " + ", ".join(str(t.get("title", "")) for t in content if isinstance(t, dict))
+    else: text = " ".join(str(content).split())
+    return f"- {message['role']}: {text[:CONTEXT_SUMMARY_CHARS]}{'…' if len(text) > CONTEXT_SUMMARY_CHARS else ''}"
+def build_context(messages: list, timer: TurnTimer = None, budget: int = CONTEXT_TOKEN_BUDGET, recent: int = CONTEXT_RECENT_MESSAGES):
+    recent_messages = [{"role": m["role"], "content": format_tool_result(m["content"])} for m in messages[-recent:]]
+    summary_lines = [_summarize_message(m) for m in messages[:-recent]]
+    def assemble():
+        summary = [{"role": "system", "content": "Summary of earlier conversation:\n" + "\n".join(summary_lines)}] if summary_lines else []
+        return summary + recent_messages
+    def size(context): return sum(estimate_tokens(m["content"]) for m in context)
+    context = assemble()
+    while size(context) > budget and (summary_lines or len(recent_messages) > 1):
+        # Over budget: fold the oldest verbatim message into the summary, then drop the oldest summary lines.
+        if len(recent_messages) > 1: summary_lines.append(_summarize_message(recent_messages.pop(0)))
+        else: summary_lines.pop(0)
+        context = assemble()
+    if timer:
+        timer.context_tokens += size(context); timer.tokens_saved += sum(estimate_tokens(str(m["content"])) for m in messages) - size(context)
+    return context
+
+# --- Assistant Fast Path ---
+# Deterministic parser for the common commands ("add task call mom tomorrow high priority", "show my
+# pending tasks", "delete task call mom"). Turns it understands confidently skip both model calls.
+FASTPATH_MIN_CONFIDENCE = 0.8
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_DUE = r"(?:(?:due|by|on|for) )?"
+_DATE_RULES = [
+    (_DUE + r"(\d{4}-\d{2}-\d{2})\b", lambda m, today: date.fromisoformat(m[1])),
+    (_DUE + r"(?:the )?day after tomorrow\b", lambda m, today: today + timedelta(days=2)),
+    (_DUE + r"tomorrow\b", lambda m, today: today + timedelta(days=1)),
+    (_DUE + r"today\b", lambda m, today: today),
+    (_DUE + r"in (\d+) (day|week)s?\b", lambda m, today: today + timedelta(days=int(m[1]) * (7 if m[2] == "week" else 1))),
+    (_DUE + r"next week\b", lambda m, today: today + timedelta(days=7)),
+    (_DUE + r"(?:(this|next) )?(" + "|".join(WEEKDAYS) + r")\b",
+     lambda m, today: today + timedelta(days=(WEEKDAYS.index(m[2]) - today.weekday()) % 7 + (7 if m[1] == "next" else 0) or 7)),
+]
+_PRIORITY_RULE = r"\b(?:with |at )?(?:(high|medium|low) priority|priority (high|medium|low)|(urgent))\b"
+_TAG_RULE = r"#\w+(?:(?:\s*,\s*|\s+and\s+|\s+)#\w+)*|\b(?:tagged|with tags?|tags?:)(?: as)? (\w+(?:(?:\s*,\s*|\s+and\s+)\w+)*)"
+# Dates, priorities and tags are only read off the end of the title ("review the monday report" keeps its title);
+# one left inside the title afterwards makes the parse ambiguous, so the model handles the turn.
+_MODIFIER_RULES = [("due", pattern, resolve) for pattern, resolve in _DATE_RULES] + [("priority", _PRIORITY_RULE, None), ("tags", _TAG_RULE, None)]
+# Phrases the parser does not understand; seeing one means the model should handle the turn.
+_UNPARSED_HINT = re.compile(r"\?|\b(?:and then|also|\d{1,2}(?::\d{2})?\s*(?:am|pm)|at \d|tonight|noon|weekend|next month|every|each|until|january|february|march|april|may|june|july|august|september|october|november|december)\b")
+_ADD_COMMAND = re.compile(r"^(?:please )?(?:(?:add|create)(?: a)?(?: new)? (?:task|todo|reminder)(?: to)?:?|remind me to) (.+)$")
+_LIST_COMMAND = re.compile(r"^(?:please )?(?:show|list|get|display|what are)(?: me)?(?: all)?(?: of)?(?: my)?(?: (pending|open|completed|done|finished|all|overdue))? (?:tasks|todos)(?: (.+?))?\??$")
+_COMPLETE_COMMAND = re.compile(r"^(?:please )?(?:(?:complete|finish|check off)(?: the)?(?: task)? (.+)|mark(?: the)?(?: task)? (.+?) as (?:done|complete|completed|finished))$")
+_DELETE_COMMAND = re.compile(r"^(?:please )?(?:delete|remove)(?: the)?(?: task)? (.+)$")
+def _take(pattern: str, text: str):
+    match = re.search(pattern, text)
+    return (match, (text[:match.start()] + " " + text[match.end():]).strip()) if match else (None, text)
+def _clean_title(text: str) -> str: return re.sub(r"\s+(?:due|by|on|with)$", "", " ".join(text.split()).strip(" ,.:"))
+def parse_command(text: str, today: date = None):
+    # Returns {"action", "args", "confidence"} or None when the text is not a command the parser knows.
+    today = today or date.today(); text = " ".join(text.strip().rstrip(".!").split()); lowered = text.lower()
+    if match := _ADD_COMMAND.match(lowered):
+        body = text[match.start(1):]; due = today; priority = "Medium"; tags = []; confidence = 0.85; seen = set() # no explicit date: defaults to today
+        while found := next(((kind, resolve, m) for kind, pattern, resolve in _MODIFIER_RULES if kind not in seen
+                             for m in [re.search(r"(?:^|(?<=[\s,]))(?:" + pattern + r")[\s,.]*$", body.lower())] if m), None):
+            kind, resolve, found = found; seen.add(kind); original = body; body = body[:found.start()]
+            if kind == "due":
+                try: due = resolve(found, today); confidence = 1.0
+                except ValueError: return {"action": "add", "args": {}, "confidence": 0.0}
+            elif kind == "priority": priority = "High" if found[3] else (found[1] or found[2]).capitalize()
+            else: tags = [tag for tag in re.split(r"\s*,\s*|\s+and\s+", original[found.start(1):found.end(1)]) if tag] if found[1] else re.findall(r"#(\w+)", original[found.start():])
+        title = _clean_title(body)
+        if not title or _UNPARSED_HINT.search(title.lower()) or any(re.search(r"(?<!\w)(?:" + pattern + r")", title.lower()) for _, pattern, _ in _MODIFIER_RULES): confidence = 0.3
+        return {"action": "add", "args": {"title": title, "priority": priority, "due_date": due.isoformat(), "tags": tags}, "confidence": confidence}
+    if match := _LIST_COMMAND.match(lowered):
+        status = {"pending": "Pending", "open": "Pending", "completed": "Completed", "done": "Completed", "finished": "Completed"}.get(match[1], "All")
+        args = {"status": status, "due": "overdue"} if match[1] == "overdue" else {"status": status}; extra = match[2]
+        if extra:
+            if extra in ("due today", "today"): args["due"] = "today"
+            elif extra in ("due tomorrow", "tomorrow"): args["due"] = "tomorrow"
+            elif extra in ("due this week", "this week"): args["due"] = "week"
+            elif extra in ("overdue", "that are overdue"): args["due"] = "overdue"
+            elif tag := re.fullmatch(r"(?:tagged|with tag|for) #?(\w+)", extra): args["tag"] = tag[1]
+            else: return {"action": "list", "args": args, "confidence": 0.3}
+        return {"action": "list", "args": args, "confidence": 1.0}
+    for action, pattern in (("complete", _COMPLETE_COMMAND), ("delete", _DELETE_COMMAND)):
+        if match := pattern.match(lowered):
+            start = match.start(1) if match[1] else match.start(2); title = _clean_title(text[start:start + len(match[1] or match[2])])
+            confidence = 0.3 if not title or _UNPARSED_HINT.search(title.lower()) or re.search(r"\b(?:all|every|tasks)\b", title.lower()) else 1.0
+            return {"action": action, "args": {"title": title}, "confidence": confidence}
+    return None
+def _filter_listed_tasks(tasks: list, args: dict, today: date):
+    today_iso = today.isoformat(); tasks = [{field: t[field] for field in TOOL_TASK_FIELDS if field in t} for t in tasks]
+    if args["status"] == "Pending": tasks = [t for t in tasks if t.get("status") != "Completed"]
+    elif args["status"] == "Completed": tasks = [t for t in tasks if t.get("status") == "Completed"]
+    due = args.get("due")
+    if due == "today": tasks = [t for t in tasks if t.get("due_date") == today_iso]
+    elif due == "tomorrow": tasks = [t for t in tasks if t.get("due_date") == (today + timedelta(days=1)).isoformat()]
+    elif due == "week": tasks = [t for t in tasks if today_iso <= t.get("due_date", "") <= (today + timedelta(days=6)).isoformat()]
+    elif due == "overdue": tasks = [t for t in tasks if t.get("due_date", "9999") < today_iso and t.get("status") != "Completed"]
+    if args.get("tag"): tasks = [t for t in tasks if args["tag"].lower() in (tag.lower() for tag in t.get("tags", []))]
+    return sorted(tasks, key=lambda t: (t.get("due_date", ""), PRIORITY_RANK.get(t.get("priority"), 1)))
+def handle_fast_path(username: str, text: str, today: date = None):
+    # Returns {"content", "tool", "write"} when the turn was answered locally, or None to fall back to the model.
+    command = parse_command(text, today)
+    if not command or command["confidence"] < FASTPATH_MIN_CONFIDENCE: return None
+    today = today or date.today(); args = command["args"]
+    if command["action"] == "list": return {"content": _filter_listed_tasks(get_tasks(username), args, today), "tool": "get_tasks", "write": False}
+    if command["action"] == "add": result = add_task(username, **args); tool = "add_task"
+    elif command["action"] == "complete": result = update_task_by_title(username, args["title"], new_status="Completed"); tool = "update_task_by_title"
+    else: result = delete_task_by_title(username, args["title"]); tool = "delete_task_by_title"
+    if result.startswith("Error:"): return None # let the model ask for clarification
+    return {"content": result, "tool": tool, "write": True}
+
+# --- Assistant Response Cache ---
+# Answers to read-only turns, keyed on the normalized prompt plus the user's task-data version, so any
+# write through the task helpers makes that user's cached answers unreachable.
+RESPONSE_CACHE_SIZE = 1024
+class ResponseCache:
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries; self.hits = 0; self.misses = 0; self._entries = OrderedDict(); self._lock = threading.Lock()
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries: self.misses += 1; return None
+            self._entries.move_to_end(key); self.hits += 1; return self._entries[key]
+    def put(self, key, response):
+        with self._lock:
+            self._entries[key] = response; self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+@st.cache_resource
+def get_response_cache(): return ResponseCache()
+def normalize_prompt(prompt: str) -> str: return " ".join(re.sub(r"[^\w\s#:-]", " ", prompt.casefold()).split())
+def response_cache_key(username: str, prompt: str):
+    # Today's date is part of the key because answers like "what's due this week?" depend on it.
+    return (username, get_task_cache().version(username), date.today().isoformat(), normalize_prompt(prompt))
+
+# --- Image Assets ---
+# Banners are WebP variants pre-rendered by `python build_assets.py` into static/banners/ and served by Streamlit's
+# static file serving (see .streamlit/config.toml), so reruns send a URL and browsers cache the file. st.image would
+# re-encode WebP bytes to PNG/JPEG on every call, so when a variant is missing get_banner() instead renders the
+# PNG/JPEG st.image passes through unchanged, once per process.
+BANNER_IMAGES = ("Folklore", "Lover", "Red", "1989", "login_banner")
+BANNER_WIDTHS = (480, 960, 1280); BANNER_DIR = "static/banners"; BANNER_QUALITY = 80
+STATIC_URL = "/app/" # Streamlit serves ./static/x at /app/static/x; st.image passes URLs in this form through untouched
+def static_url(path: str) -> str: return STATIC_URL + path.replace(os.sep, "/")
+def banner_variant_path(name: str, width: int) -> str: return os.path.join(BANNER_DIR, f"{name}-{width}.webp")
+def render_banner(name: str, width: int, image_format: str = "WEBP") -> bytes:
+    # Never upscales: a variant wider than its source keeps the source size. For WebP, encodes lossy and lossless
+    # and keeps the smaller; lossless wins for flat, few-colour art like the login banner.
+    with Image.open(f"images/{name}.png") as image:
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        if image.width > width: image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        if image_format != "WEBP": image_format = "PNG" if image.mode == "RGBA" else "JPEG" # the format st.image would pick
+        encoded = []
+        for options in ({"quality": BANNER_QUALITY}, {"lossless": True}) if image_format == "WEBP" else ({"quality": 85, "optimize": True},):
+            buffer = io.BytesIO(); image.save(buffer, image_format, **options, **({"method": 6} if image_format == "WEBP" else {})); encoded.append(buffer.getvalue())
+        return min(encoded, key=len)
+@st.cache_resource(max_entries=32)
+def get_banner(name: str, width: int = BANNER_WIDTHS[-1]):
+    # Returns a static URL or image bytes for st.image: the smallest variant at least `width` pixels wide (the widest
+    # one for anything bigger). build_assets.py stops at the first width that covers the source and skips variants
+    # that wouldn't be smaller, so a missing variant falls back to the next wider file, then the next narrower one.
+    width = next((w for w in BANNER_WIDTHS if w >= width), BANNER_WIDTHS[-1])
+    for candidate in [w for w in BANNER_WIDTHS if w >= width] + sorted((w for w in BANNER_WIDTHS if w < width), reverse=True):
+        if os.path.exists(banner_variant_path(name, candidate)): return static_url(banner_variant_path(name, candidate))
+    return render_banner(name, width, image_format="AUTO")
+
+# --- Theme and CSS ---
+# Theme CSS is built and minified once per era. The remote Google Fonts @import is gone and Poppins is not vendored
+# (it was imported but never applied), so by default titles use Streamlit's bundled font and nothing is fetched from
+# a third-party CDN. Poppins comes back only if its OFL woff2 files are added to static/fonts/ (see the README there).
+FONT_DIR = "static/fonts"; FONT_WEIGHTS = (400, 600, 700)
 def get_era_theme_config(era):
     themes = {
         "1989": {"bg": "#e0f7fa", "text": "#0d47a1", "btn_bg": "#1976d2", "btn_text": "#ffffff", "cal_bg": "#b3e5fc", "cal_text": "#01579b", "btn_hover": "#1565c0"},
@@ -66,12 +962,16 @@ def get_era_theme_config(era):
         "Folklore": {"bg": "#f0f0f0", "text": "#4a4a4a", "btn_bg": "#757575", "btn_text": "#ffffff", "cal_bg": "#e0e0e0", "cal_text": "#333333", "btn_hover": "#616161"}
     }
     return themes.get(era, themes["Folklore"])
-def apply_global_styles():
-    if "era_mode" not in st.session_state: st.session_state.era_mode = "Folklore"
-    current_theme = get_era_theme_config(st.session_state.era_mode)
-    st.markdown(f"""
-    <style>
-        @import url('https://fonts.googleapis.com/css2?family=Poppins:wght@400;600;700&display=swap');
+def _font_css() -> str:
+    files = {weight: os.path.join(FONT_DIR, f"Poppins-{weight}.woff2") for weight in FONT_WEIGHTS}
+    faces = [f"@font-face {{ font-family: 'Poppins'; font-style: normal; font-weight: {weight}; font-display: swap; src: local('Poppins'), url('{static_url(path)}') format('woff2'); }}"
+             for weight, path in files.items() if os.path.exists(path)]
+    return "\n".join(faces) + "\nh1, h2, .themed-title { font-family: 'Poppins', sans-serif; }" if faces else ""
+@st.cache_resource
+def get_era_css(era: str) -> str:
+    current_theme = get_era_theme_config(era)
+    css = f"""
+        {_font_css()}
         .stApp {{ background-color: {current_theme['bg']}; }}
         h1 {{ color: {current_theme['text']} !important; }}
         h2 {{ color: {current_theme['text']} !important; font-size: 1.5rem; }}
@@ -79,10 +979,26 @@ def apply_global_styles():
         .stButton > button {{ background-color: {current_theme['btn_bg']}; color: {current_theme['btn_text']}; border-radius: 8px; border: none; }}
         .logout-button-container .stButton > button {{ background-color: #d32f2f !important; }}
         .logout-button-container .stButton > button p {{ color: #ffffff !important; }}
-    </style>
-    """, unsafe_allow_html=True)
+    """
+    return "<style>" + re.sub(r"\s*([{};,>])\s*", r"\1", " ".join(css.split())) + "</style>"
+def apply_global_styles():
+    if "era_mode" not in st.session_state: st.session_state.era_mode = "Folklore"
+    st.markdown(get_era_css(st.session_state.era_mode), unsafe_allow_html=True)
 
 # --- SIDEBAR LOGIC ---
+def build_debug_panel():
+    st.markdown("---")
+    with st.expander("🛠️ Debug Panel"):
+        if last := st.session_state.get("last_rerun_profile"):
+            ms = lambda seconds: f"{seconds * 1000:.0f} ms"; other = last["total"] - sum(last[kind]["seconds"] for kind in PROFILE_KINDS)
+            st.caption(f"Previous {last['page']} rerun: {ms(last['total'])} total")
+            st.caption(f"Mongo {ms(last['db']['seconds'])} ({last['db']['calls']} call(s), {last['db']['docs']} doc(s)) · OpenAI {ms(last['llm']['seconds'])} ({last['llm']['tokens']} token(s)) · "
+                       f"Assets {ms(last['asset']['seconds'])} · Widgets/other {ms(max(other, 0.0))}")
+        cache_stats = get_task_cache_stats(); st.caption(f"Task cache hit rate {cache_stats['hit_rate']:.0%} ({cache_stats['misses']} miss(es)) · watcher: {cache_stats['watcher']['mode']}")
+        rows = [{"Operation": f"{r['kind']}:{r['name']}", "Calls": r["count"], "Mean ms": round(r["seconds"] / r["count"] * 1000, 1), "Max ms": round(r["max"] * 1000, 1),
+                 "Docs": r["docs"], "Tokens": r["tokens_in"] + r["tokens_out"], "Errors": r["errors"]} for r in get_metrics().snapshot()]
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+        st.download_button("Download Prometheus Metrics", render_prometheus(), "taskflow_metrics.prom", mime="text/plain", use_container_width=True)
 def build_sidebar():
     if not st.session_state.get("login_state"): return
     with st.sidebar:
@@ -97,9 +1013,13 @@ def build_sidebar():
         st.markdown("---")
         
         st.subheader("Stats at a Glance")
-        all_tasks = get_tasks(st.session_state.user); total_tasks = len(all_tasks)
-        completed_tasks = len([t for t in all_tasks if t['status'] == 'Completed'])
-        st.metric("Pending Tasks", total_tasks - completed_tasks); st.metric("Completed Tasks", completed_tasks)
+        stats = get_task_stats(st.session_state.user)
+        pending_col, completed_col = st.columns(2)
+        pending_col.metric("Pending Tasks", stats["pending"]); completed_col.metric("Completed Tasks", stats["completed"])
+        overdue_col, today_col = st.columns(2)
+        overdue_col.metric("Overdue", stats["overdue"]); today_col.metric("Due Today", stats["due_today"])
+        st.caption(f"🔴 {stats['pending_high']} High · 🟠 {stats['pending_medium']} Medium · 🟢 {stats['pending_low']} Low")
+        if st.query_params.get("debug") == "1" or os.environ.get("TASKFLOW_DEBUG_PANEL") == "1": build_debug_panel()
         
         # --- THIS IS THE FIX: Logout button is now at the bottom ---
         st.markdown("---")